@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+
+Opt-in: the Procfile serves Backend.wsgi, which is faster for these DB-bound
+reads (see bench_servers) and streams ?stream=1 exports, where the async views
+build them in memory. To serve ASGI instead, run
+
+    gunicorn 'Backend.asgi' -k uvicorn.workers.UvicornWorker
+
+which routes the catalog endpoints to the async views in Backend.books.async_views.
 """
 
 import os
@@ -12,5 +20,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+os.environ.setdefault('BOOKS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
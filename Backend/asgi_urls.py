@@ -0,0 +1,23 @@
+"""URL configuration for ASGI deployments: the same routes, with the async views."""
+from django.urls import path
+
+from Backend.books.async_views import AsyncAuthorView, AsyncBookView, AsyncReviewView, AsyncUserDetailsView
+from Backend.books.views import AuthorView, BookView, ReviewView, UserDetailsView
+from Backend.urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    AuthorView: AsyncAuthorView,
+    BookView: AsyncBookView,
+    ReviewView: AsyncReviewView,
+    UserDetailsView: AsyncUserDetailsView,
+}
+
+
+def async_pattern(pattern):
+    view_class = getattr(getattr(pattern, 'callback', None), 'view_class', None)
+    if view_class not in ASYNC_VIEWS:
+        return pattern
+    return path(str(pattern.pattern), ASYNC_VIEWS[view_class].as_view(), name=pattern.name)
+
+
+urlpatterns = [async_pattern(pattern) for pattern in sync_urlpatterns]
@@ -1,21 +1,130 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
 from Backend.books.models import FullUser, Book, Review, Author
+from Backend.books.moderation import moderate
+from Backend.books.search import search_filter
+
+
+def get_count_limit():
+    """Changelists of more rows than this show an estimated count."""
+    return getattr(settings, 'ADMIN_COUNT_LIMIT', 10000)
+
+
+def estimated_count(queryset):
+    """A cheap upper bound on the rows of the queryset's table, or None when the database cannot tell."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # The span of the ids, read off both ends of the table: only rows deleted in between are miscounted.
+            table = connection.ops.quote_name(table)
+            cursor.execute(f'SELECT (SELECT MAX(rowid) FROM {table}) - (SELECT MIN(rowid) FROM {table}) + 1')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Pages a changelist without an exact COUNT(*) of a large table. The whole
+    table is counted from an estimate, a filtered list exactly but only up to
+    the count limit: narrow it down further to see its last pages.
+    """
+
+    @cached_property
+    def count(self):
+        queryset, limit = self.object_list, get_count_limit()
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    A ModelAdmin for tables too large to count or scan. ``search_fields`` only
+    take index-backed lookups: ``=field`` (exact) and ``^field`` (prefix) are
+    case-sensitive so they read a range of the column's index, ``@field``
+    matches the model's documents in the full-text index.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q()
+        for field in self.search_fields:
+            condition |= self.search_condition(queryset.model, field[0], field[1:], search_term)
+        return queryset.filter(condition), False
+
+    def search_condition(self, model, lookup, path, term):
+        name, _, rest = path.partition('__')
+        if rest:
+            # A subquery on the related table's index rather than a join scanned from this side.
+            related = model._meta.get_field(name).related_model
+            return Q(**{f'{name}__in': related.objects.filter(self.search_condition(related, lookup, rest, term))
+                        .values('pk')})
+        if lookup == '=':
+            return Q(**{name: term})
+        if lookup == '^':
+            return Q(**{f'{name}__gte': term, f'{name}__lt': term + '\U0010ffff'})
+        if lookup == '@':
+            return search_filter(term, self.search_kind)
+        raise ValueError(f'Unindexed search field: {lookup}{path}')
 
 
 # Register your models here.
 
-class FullUserAdmin(admin.ModelAdmin):
+class FullUserAdmin(ScalableAdmin):
     list_display = ('username', 'password', 'first_name', 'last_name', 'email', 'gender',
                     'is_staff', 'auth_token')
+    list_select_related = ('auth_token',)
+    search_fields = ('^username',)
 
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(ScalableAdmin):
     list_display = ('name', "bio")
-class BookAdmin(admin.ModelAdmin):
+    search_fields = ('@name',)
+    search_kind = 'author'
+class BookAdmin(ScalableAdmin):
     list_display = ('title', 'author', 'publication_date', 'isbn')
+    list_select_related = ('author',)
+    list_filter = ('publication_date',)
+    search_fields = ('@title', '=isbn')
+    search_kind = 'book'
+    autocomplete_fields = ('author',)
+
+class ReviewAdmin(ScalableAdmin):
+    list_display = ('book', 'user', 'rating', 'review_text', 'status', "created_at")
+    list_select_related = ('book', 'user')
+    list_filter = ('status',)
+    search_fields = ('^book__title', '^user__username')
+    autocomplete_fields = ('book', 'user')
+    actions = ['approve', 'reject']
+
+    def moderate(self, request, queryset, decision):
+        # One UPDATE for the whole selection, instead of saving the reviews one by one.
+        updated = moderate(queryset, decision)
+        self.message_user(request, f'{updated} reviews {decision}.', messages.SUCCESS)
+
+    @admin.action(description='Approve the selected reviews')
+    def approve(self, request, queryset):
+        self.moderate(request, queryset, Review.Status.APPROVED)
 
-class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('book', 'user', 'rating', 'review_text', "created_at")
+    @admin.action(description='Reject the selected reviews')
+    def reject(self, request, queryset):
+        self.moderate(request, queryset, Review.Status.REJECTED)
 
 admin.site.register(FullUser, FullUserAdmin)
 admin.site.register(Author, AuthorAdmin)
@@ -0,0 +1,142 @@
+import json
+
+from django.db import connection, transaction
+from django.db.models import Count, F, QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from Backend.books.cache import invalidate_reviews
+from Backend.books.conditional import touch_books
+from Backend.books.jobs import enqueue, task
+from Backend.books.models import Author, Book, Review, empty_rating_histogram
+
+
+def apply_rating_change(book_id, rating, delta):
+    """Add (delta=1) or remove (delta=-1) one rating from a book's stored aggregates."""
+    with transaction.atomic():
+        histogram = (Book.objects.select_for_update()
+                     .values_list('rating_histogram', flat=True).get(pk=book_id))
+        histogram[rating - 1] += delta
+        Book.objects.filter(pk=book_id).update(
+            review_count=F('review_count') + delta,
+            rating_sum=F('rating_sum') + delta * rating,
+            rating_histogram=histogram,
+            updated_at=timezone.now(),
+        )
+
+
+def apply_rating_changes(counts, delta):
+    """
+    Add (delta=1) or remove (delta=-1) many ratings at once: ``counts`` holds
+    (book_id, rating, number of reviews) rows. One UPDATE per book.
+    """
+    by_book = {}
+    for book_id, rating, n in counts:
+        by_book.setdefault(book_id, []).append((rating, n))
+    if not by_book:
+        return
+    table = connection.ops.quote_name(Book._meta.db_table)
+    sql = (f'UPDATE {table} SET review_count = review_count + %s, rating_sum = rating_sum + %s, '
+           f'rating_histogram = %s, updated_at = %s WHERE id = %s')
+    with transaction.atomic(), connection.cursor() as cursor:
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        histograms = (Book.objects.select_for_update().filter(id__in=by_book)
+                      .values_list('id', 'rating_histogram'))
+        rows = []
+        for book_id, histogram in histograms:
+            changes = by_book[book_id]
+            for rating, n in changes:
+                histogram[rating - 1] += delta * n
+            rows.append((delta * sum(n for _, n in changes), delta * sum(rating * n for rating, n in changes),
+                         json.dumps(histogram), now, book_id))
+        cursor.executemany(sql, rows)
+
+
+def rebuild_rating_aggregates(book_ids=None, batch_size=5000):
+    """
+    Recompute the stored aggregates from the approved reviews with one grouped
+    scan, for every book or only for ``book_ids``. Returns the number of books
+    that have at least one approved review.
+    """
+    books = Book.objects.all()
+    reviews = Review.objects.filter(status=Review.Status.APPROVED)
+    if book_ids is not None:
+        books = books.filter(id__in=book_ids)
+        reviews = reviews.filter(book_id__in=book_ids)
+
+    table = connection.ops.quote_name(Book._meta.db_table)
+    sql = (f'UPDATE {table} SET review_count = %s, rating_sum = %s, rating_histogram = %s, updated_at = %s '
+           f'WHERE id = %s')
+    grouped = (reviews.order_by('book_id', 'rating').values_list('book_id', 'rating')
+               .annotate(n=Count('id')).iterator(chunk_size=batch_size))
+
+    updated = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        now = timezone.now()
+        books.exclude(review_count=0, rating_sum=0, rating_histogram=empty_rating_histogram()).update(
+            review_count=0, rating_sum=0, rating_histogram=empty_rating_histogram(), updated_at=now)
+        batch, current, histogram = [], None, None
+        for book_id, rating, n in grouped:
+            if book_id != current:
+                if current is not None:
+                    batch.append(_aggregate_row(current, histogram, now))
+                current, histogram = book_id, empty_rating_histogram()
+            histogram[rating - 1] = n
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                updated += len(batch)
+                batch = []
+        if current is not None:
+            batch.append(_aggregate_row(current, histogram, now))
+        cursor.executemany(sql, batch)
+        updated += len(batch)
+    return updated
+
+
+@task('rebuild_rating_aggregates')
+def rebuild_book_aggregates(target, payload):
+    rebuild_rating_aggregates(book_ids=[int(target)])
+    invalidate_reviews([], [int(target)])
+    enqueue('refresh_rankings', target)
+
+
+def _aggregate_row(book_id, histogram, now):
+    count = sum(histogram)
+    total = sum(rating * n for rating, n in enumerate(histogram, start=1))
+    return count, total, json.dumps(histogram), connection.ops.adapt_datetimefield_value(now), book_id
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (Review.objects.filter(pk=instance.pk)
+                                     .values_list('book_id', 'rating', 'status').first())
+
+
+@receiver(post_save, sender=Review)
+def update_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    current = (instance.book_id, instance.rating, instance.status)
+    if previous == current:
+        # Only the text changed, which the book shows with its approved reviews.
+        if instance.status == Review.Status.APPROVED:
+            touch_books([instance.book_id])
+        return
+    # Only approved reviews are counted.
+    if previous is not None and previous[2] == Review.Status.APPROVED:
+        apply_rating_change(previous[0], previous[1], -1)
+    if instance.status == Review.Status.APPROVED:
+        apply_rating_change(instance.book_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def update_aggregates_on_delete(sender, instance, origin=None, **kwargs):
+    # When the book (or its author) is being deleted there is nothing left to update.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Book, Author) or instance.status != Review.Status.APPROVED:
+        return
+    apply_rating_change(instance.book_id, instance.rating, -1)
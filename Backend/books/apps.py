@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "Backend.books"
+
+    def ready(self):
+        # Connects the signal receivers; aggregates first, the leaderboards read what it maintains.
+        from Backend.books import aggregates, auth, cache, conditional, db, leaderboards, metrics  # noqa: F401
+        from Backend.books.search import install_search_triggers
+        post_migrate.connect(install_search_triggers, sender=self)
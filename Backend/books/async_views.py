@@ -0,0 +1,152 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from Backend.books.cache import cache_response
+from Backend.books.conditional import conditional_get, validated, latest, author_books_state
+from Backend.books.fieldsets import AUTHOR, BOOK, REVIEW, BOOK_LIST_INCLUDE, BOOK_DETAIL_INCLUDE, \
+    REVIEW_LIST_INCLUDE, REVIEW_DETAIL_INCLUDE, book_reviews, embed_reviews, streamable
+from Backend.books.filters import BOOKS, REVIEWS
+from Backend.books.models import FullUser, Author, Book, Review
+from Backend.books.serializers import UserSerializer
+from Backend.books.streaming import buffered_response, wants_stream
+from Backend.books.views import AuthorView, BookView, ReviewView, UserDetailsView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView with an async dispatch, for ASGI deployments. Authentication,
+    permissions and content negotiation run in a worker thread. Async handlers
+    are awaited on the event loop; sync handlers (the writes, which rely on
+    transactions and model signals) run in a worker thread.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+async def fetch_page(paginator, queryset, request):
+    return paginator.build_page([obj async for obj in paginator.page_queryset(queryset, request)])
+
+
+class AsyncUserDetailsView(AsyncAPIView, UserDetailsView):
+    async def get(self, request):
+        user = await FullUser.objects.aget(pk=request.user.pk)
+        return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
+
+
+class AsyncAuthorView(AsyncAPIView, AuthorView):
+    @conditional_get
+    @cache_response
+    async def get(self, request, author_id=None):
+        fields = AUTHOR.select(request)
+        if author_id:
+            row = await AUTHOR.values(Author.objects.filter(pk=author_id), fields, 'updated_at').afirst()
+            if row is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return validated(request, Response(AUTHOR.serialize([row], fields)[0]), row['updated_at'])
+
+        paginator = self.pagination_class()
+        authors = AUTHOR.values(Author.objects.all(), fields, *paginator.get_ordering_fields())
+        authors = await fetch_page(paginator, authors, request)
+        return paginator.get_paginated_response(AUTHOR.serialize(authors, fields))
+
+
+class AsyncBookView(AsyncAPIView, BookView):
+    @conditional_get
+    @cache_response
+    async def get(self, request, book_id=None, author_id=None):
+        if book_id:
+            fields = BOOK.select(request, BOOK_DETAIL_INCLUDE)
+            rows = [row async for row in BOOK.values(Book.objects.filter(pk=book_id), fields, 'id', 'updated_at')]
+            if not rows:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            data = BOOK.serialize(rows, fields)
+            if 'reviews' in fields:
+                embed_reviews(data, rows, [row async for row in book_reviews([book_id])])
+            return validated(request, Response(data[0]), rows[0]['updated_at'])
+
+        fields = BOOK.select(request, BOOK_LIST_INCLUDE)
+        books = Book.objects.all()
+        state = None
+        if author_id:
+            state = await sync_to_async(author_books_state)(author_id)
+            if state is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            books = books.filter(author_id=author_id)
+
+        books = BOOKS.filter(books, request)
+        ordering = BOOKS.ordering(request)
+
+        if wants_stream(request):
+            books = books.order_by(*ordering)
+            return await sync_to_async(buffered_response)(request, books, streamable(BOOK, fields))
+
+        paginator = self.pagination_class(ordering)
+        books = BOOK.values(books, fields, *paginator.get_ordering_fields())
+        rows = await fetch_page(paginator, books, request)
+        data = BOOK.serialize(rows, fields)
+        if 'reviews' in fields:
+            embed_reviews(data, rows, [row async for row in book_reviews([row['id'] for row in rows])])
+        response = paginator.get_paginated_response(data)
+        if state is not None:
+            updated_at, last_book, books_count = state
+            response = validated(request, response, latest(updated_at, last_book), books_count)
+        return response
+
+
+class AsyncReviewView(AsyncAPIView, ReviewView):
+    @conditional_get
+    @cache_response
+    async def get(self, request, review_id=None, author_id=None, book_id=None):
+        if review_id and author_id and book_id:
+            fields = REVIEW.select(request, REVIEW_DETAIL_INCLUDE)
+            row = await REVIEW.values(Review.objects.filter(pk=review_id, status=Review.Status.APPROVED),
+                                      fields, 'updated_at', 'book__updated_at').afirst()
+            if row is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return validated(request, Response(REVIEW.serialize([row], fields)[0]),
+                             latest(row['updated_at'], row['book__updated_at']))
+
+        fields = REVIEW.select(request, REVIEW_LIST_INCLUDE)
+        reviews = Review.objects.filter(status=Review.Status.APPROVED)
+        if author_id and book_id:
+            if not await Book.objects.filter(id=book_id).aexists():
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            reviews = reviews.filter(book_id=book_id)
+
+        reviews = REVIEWS.filter(reviews, request)
+        ordering = REVIEWS.ordering(request, ('book',) if book_id else ())
+
+        if wants_stream(request):
+            reviews = reviews.order_by(*ordering)
+            return await sync_to_async(buffered_response)(request, reviews, streamable(REVIEW, fields))
+
+        paginator = self.pagination_class(ordering)
+        reviews = REVIEW.values(reviews, fields, *paginator.get_ordering_fields())
+        reviews = await fetch_page(paginator, reviews, request)
+        return paginator.get_paginated_response(REVIEW.serialize(reviews, fields))
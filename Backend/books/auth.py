@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from Backend.books.cache import bump, get_versions, is_shared
+from Backend.books.models import FullUser
+
+# Access tokens carry enough of the user to authorize a request without loading
+# it. The principal version is the user's cache version token at issue time:
+# saving or deleting the user bumps it, so tokens issued before the change stop
+# being trusted and fall back to a database load. Versions only revoke anything
+# when every process sees them, so with a cache private to each process the
+# claims are never trusted and a loaded user is reused for AUTH_PRINCIPAL_CACHE_TTL.
+PRINCIPAL_CLAIMS = ('username', 'is_staff', 'is_superuser')
+VERSION_CLAIM = 'principal_version'
+
+
+def principal_version(user_id):
+    return get_versions([f'user:{user_id}'])[0]
+
+
+class PrincipalTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in PRINCIPAL_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[VERSION_CLAIM] = principal_version(user.pk)
+        return token
+
+
+class PrincipalCache:
+    """A small thread-safe LRU of loaded users, each entry valid for ``ttl`` seconds."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, entry_version, expires = entry
+            if entry_version != version or expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Every request gets its own copy, so nothing it does to request.user leaks.
+        return copy.copy(user)
+
+    def set(self, user_id, version, user):
+        with self._lock:
+            self._entries[user_id] = (copy.copy(user), version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principals = PrincipalCache(getattr(settings, 'AUTH_PRINCIPAL_CACHE_SIZE', 1024),
+                            getattr(settings, 'AUTH_PRINCIPAL_CACHE_TTL', 60))
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query. The user comes from
+    the token claims while their principal version is current (in a shared
+    cache), otherwise from
+    the in-process principal cache, and only then from the database. Fields
+    that are not in the token are loaded on first access.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        version = principal_version(user_id)
+        if is_shared() and validated_token.get(VERSION_CLAIM) == version:
+            return self.user_from_claims(validated_token)
+
+        user = principals.get(user_id, version)
+        if user is None:
+            user = super().get_user(validated_token)
+            principals.set(user_id, version, user)
+        return user
+
+    def user_from_claims(self, validated_token):
+        claims = {claim: validated_token.get(claim) for claim in PRINCIPAL_CLAIMS}
+        claims['id'] = validated_token[api_settings.USER_ID_CLAIM]
+        claims['is_active'] = True  # deactivating a user bumps their version
+        if None in claims.values():
+            raise AuthenticationFailed(_('Token is missing user claims'), code='bad_claims')
+        names = [f.attname for f in FullUser._meta.concrete_fields if f.attname in claims]
+        return FullUser.from_db(router.db_for_read(FullUser), names, [claims[name] for name in names])
+
+
+@receiver([post_save, post_delete], sender=FullUser)
+def revoke_principal(sender, instance, **kwargs):
+    bump(f'user:{instance.pk}')
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from Backend.books.cache import bump, invalidate_reviews
+from Backend.books.conditional import touch_authors, touch_books
+from Backend.books.jobs import enqueue_many
+from Backend.books.leaderboards import move_book_rankings
+from Backend.books.models import FullUser, Author, Book, Review
+from Backend.books.serializers import BookSerializer, ReviewSerializer, BookBatchSerializer, ReviewBatchSerializer
+
+
+def get_max_batch_size():
+    return getattr(settings, 'BATCH_WRITE_MAX_SIZE', 1000)
+
+
+def validate_items(items, serializer_class):
+    """
+    Validate every item and return (rows, errors): ``rows`` holds the validated data of
+    each item or None, ``errors`` one dict per item (empty when valid) so clients can
+    match them by index.
+    """
+    if len(items) > get_max_batch_size():
+        return None, Response({'detail': f'At most {get_max_batch_size()} items can be written at once.'},
+                              status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    serializer = serializer_class(data=items, many=True)
+    if serializer.is_valid():
+        return [dict(row) for row in serializer.validated_data], [{} for _ in items]
+    # A ListSerializer only keeps validated data when every item is valid, so validate per item here.
+    rows, errors = [], []
+    for item, item_errors in zip(items, serializer.errors):
+        rows.append(None if item_errors else dict(serializer_class(data=item).run_validation(item)))
+        errors.append(dict(item_errors))
+    return rows, errors
+
+
+def missing(model, ids):
+    ids = set(ids)
+    return ids - set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def add_error(errors, index, field, message):
+    errors[index].setdefault(field, []).append(message)
+
+
+def error_response(errors):
+    return Response({'errors': errors}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def write_books(items, upsert=False):
+    """Create (or with ``upsert`` create-or-update by ISBN) a batch of books atomically."""
+    rows, errors = validate_items(items, BookBatchSerializer)
+    if isinstance(errors, Response):
+        return errors
+
+    valid = [(i, row) for i, row in enumerate(rows) if row is not None]
+    unknown_authors = missing(Author, (row['author'] for _, row in valid))
+    existing = set() if upsert else set(Book.objects.filter(isbn__in=[row['isbn'] for _, row in valid])
+                                        .values_list('isbn', flat=True))
+    seen = set()
+    for i, row in valid:
+        if row['author'] in unknown_authors:
+            add_error(errors, i, 'author', f'Invalid pk "{row["author"]}" - object does not exist.')
+        if row['isbn'] in existing:
+            add_error(errors, i, 'isbn', 'book with this isbn already exists.')
+        if row['isbn'] in seen:
+            add_error(errors, i, 'isbn', 'Duplicate ISBN in this batch.')
+        seen.add(row['isbn'])
+    if any(errors):
+        return error_response(errors)
+
+    books = [Book(author_id=row.pop('author'), **row) for row in rows]
+    author_ids = {book.author_id for book in books}
+    with transaction.atomic():
+        if upsert:
+            # Books moved to another author also leave their previous author's list.
+            previous = dict(Book.objects.filter(isbn__in=[book.isbn for book in books])
+                            .values_list('isbn', 'author_id'))
+            author_ids.update(previous.values())
+            touch_authors({previous[book.isbn] for book in books
+                           if previous.get(book.isbn, book.author_id) != book.author_id})
+            Book.objects.bulk_create(books, update_conflicts=True, unique_fields=['isbn'],
+                                     update_fields=['title', 'author', 'publication_date', 'updated_at'])
+            # Upserted rows come back without primary keys on SQLite, read them back in batch order.
+            by_isbn = Book.objects.in_bulk([book.isbn for book in books], field_name='isbn')
+            books = [by_isbn[book.isbn] for book in books]
+            move_book_rankings([book.id for book in books])
+        else:
+            Book.objects.bulk_create(books)
+        bump('books', 'reviews', *(f'book:{book.id}' for book in books),
+             *(f'author:{author_id}' for author_id in author_ids))
+    return Response({'results': BookSerializer(books, many=True).data}, status=status.HTTP_201_CREATED)
+
+
+def write_reviews(items):
+    """Create reviews, or update those that carry an ``id``, in one transaction."""
+    rows, errors = validate_items(items, ReviewBatchSerializer)
+    if isinstance(errors, Response):
+        return errors
+
+    valid = [(i, row) for i, row in enumerate(rows) if row is not None]
+    unknown = {
+        'book': missing(Book, (row['book'] for _, row in valid)),
+        'user': missing(FullUser, (row['user'] for _, row in valid)),
+        'id': missing(Review, (row['id'] for _, row in valid if 'id' in row)),
+    }
+    for i, row in valid:
+        for field, ids in unknown.items():
+            if field in row and row[field] in ids:
+                add_error(errors, i, field, f'Invalid pk "{row[field]}" - object does not exist.')
+    if any(errors):
+        return error_response(errors)
+
+    reviews = [Review(book_id=row.pop('book'), user_id=row.pop('user'), **row) for row in rows]
+    created = [review for review in reviews if review.id is None]
+    updated = [review for review in reviews if review.id is not None]
+    with transaction.atomic():
+        previous_books = set(Review.objects.filter(id__in=[r.id for r in updated]).values_list('book_id', flat=True))
+        Review.objects.bulk_create(created)
+        now = timezone.now()
+        for review in updated:
+            review.updated_at = now
+        Review.objects.bulk_update(updated, ['book', 'user', 'rating', 'review_text', 'updated_at'])
+        book_ids = previous_books | {review.book_id for review in reviews}
+        # The books' aggregates and rankings are recomputed by a job once this commits.
+        enqueue_many('rebuild_rating_aggregates', book_ids)
+        touch_books(book_ids)
+        invalidate_reviews([review.id for review in reviews], book_ids)
+
+    # Updated rows keep their original created_at and status, which the batch did not load.
+    stored = {pk: rest for pk, *rest in Review.objects.filter(id__in=[r.id for r in updated])
+              .values_list('id', 'created_at', 'status')}
+    for review in updated:
+        review.created_at, review.status = stored[review.id]
+    code = status.HTTP_201_CREATED if not updated else status.HTTP_200_OK
+    return Response({'results': ReviewSerializer(reviews, many=True).data}, status=code)
@@ -0,0 +1,234 @@
+import asyncio
+import functools
+import hashlib
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+from Backend.books.compression import negotiate
+from Backend.books.models import FullUser, Author, Book, Review
+
+# Cached GET responses are keyed on the request plus the current version of every
+# scope they were built from. Writes replace the version token of the scopes they
+# touch, so stale entries are simply never read again and age out of the cache.
+#
+#   authors        the author list
+#   books          the book list
+#   reviews        the review list
+#   author:<id>    an author and the list of their books
+#   book:<id>      a book with its reviews, and the list of its reviews
+#   review:<id>    a single review
+#   user:<id>      the principal version in a user's access tokens (Backend.books.auth)
+
+VERSION_KEY = 'books:version:%s'
+RESPONSE_KEY = 'books:response:%s'
+# Compressed bodies of a cached response, stored by CompressionMiddleware.
+VARIANT_KEY = '%s:%s'
+VALIDATORS = ('ETag', 'Last-Modified')
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'VERSION_CACHE_ALIAS', 'default')]
+
+
+def is_shared():
+    """Whether all processes see the same versions. The local memory backend is private to each one."""
+    return not isinstance(get_version_cache(), LocMemCache)
+
+
+def get_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else None}
+
+
+stats = CacheStats()
+
+
+def get_versions(scopes):
+    cache = get_version_cache()
+    keys = [VERSION_KEY % scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Versions are random tokens rather than counters so an evicted version
+            # can never come back with a value that matches an old response.
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    get_version_cache().set_many({VERSION_KEY % scope: uuid.uuid4().hex for scope in scopes}, None)
+
+
+def response_key(request, scopes):
+    query = sorted(request.query_params.lists())
+    accepted = getattr(request, 'accepted_media_type', '')
+    # Pagination links are absolute, so the same path under another host or scheme is another response.
+    raw = '|'.join([request.scheme, request.get_host(), request.path, repr(query), accepted] + get_versions(scopes))
+    return RESPONSE_KEY % hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_response(handler):
+    """
+    Cache the data of a successful GET handler. The view's ``get_cache_scopes``
+    receives the URL kwargs and returns the version scopes the response depends on.
+    Works on both sync and async handlers.
+
+    Hits are served from the compressed variant for the request's
+    Accept-Encoding when CompressionMiddleware has stored one.
+    """
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(view, request, *args, **kwargs):
+            keys = await sync_to_async(lookup_keys)(request, view.get_cache_scopes(**kwargs))
+            response = cached_response(keys, await get_cache().aget_many(keys))
+            if response is None:
+                response = await handler(view, request, *args, **kwargs)
+                await sync_to_async(store_response)(keys[0], response)
+            return response
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        keys = lookup_keys(request, view.get_cache_scopes(**kwargs))
+        response = cached_response(keys, get_cache().get_many(keys))
+        if response is None:
+            response = handler(view, request, *args, **kwargs)
+            store_response(keys[0], response)
+        return response
+    return wrapper
+
+
+def lookup_keys(request, scopes):
+    """The response key, followed by the key of its variant in the encoding the client accepts."""
+    key = response_key(request, scopes)
+    encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    return [key, VARIANT_KEY % (key, encoding)] if encoding else [key]
+
+
+def cached_response(keys, entries):
+    variant = entries.get(keys[-1]) if len(keys) > 1 else None
+    entry = entries.get(keys[0])
+    stats.record(hit=variant is not None or entry is not None)
+    if variant is not None:
+        response = HttpResponse(variant['content'], content_type=variant['content_type'])
+        response['Content-Encoding'] = variant['encoding']
+        patch_vary_headers(response, ('Accept-Encoding',))
+        entry = variant
+    elif entry is not None:
+        response = Response(entry['data'])
+        response.cache_key = keys[0]
+    else:
+        return None
+    for header, value in entry['validators'].items():
+        response[header] = value
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def validators(response):
+    """The ETag and Last-Modified of a response, kept with its cached copies to answer conditional requests."""
+    return {header: response[header] for header in VALIDATORS if response.has_header(header)}
+
+
+def store_response(key, response):
+    if not isinstance(response, Response):
+        return  # streamed exports are not cached
+    if response.status_code == 200:
+        get_cache().set(key, {'data': response.data, 'validators': validators(response)}, get_timeout())
+        response.cache_key = key
+    response['X-Cache'] = 'MISS'
+
+
+def store_variant(key, response, encoding):
+    get_cache().set(VARIANT_KEY % (key, encoding), {
+        'content': response.content, 'content_type': response['Content-Type'], 'encoding': encoding,
+        'validators': validators(response),
+    }, get_timeout())
+
+
+@receiver([post_save, post_delete], sender=Author)
+def invalidate_author(sender, instance, **kwargs):
+    book_ids = list(Book.objects.filter(author_id=instance.pk).values_list('id', flat=True))
+    bump('authors', 'books', f'author:{instance.pk}', *(f'book:{book_id}' for book_id in book_ids))
+
+
+@receiver(pre_save, sender=Book)
+def remember_previous_author(sender, instance, raw=False, **kwargs):
+    instance._previous_author_id = None
+    if instance.pk and not raw:
+        instance._previous_author_id = (Book.objects.filter(pk=instance.pk)
+                                        .values_list('author_id', flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    scopes = {'books', 'reviews', f'book:{instance.pk}', f'author:{instance.author_id}'}
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if previous_author_id is not None:
+        scopes.add(f'author:{previous_author_id}')
+    bump(*scopes)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review(sender, instance, origin=None, **kwargs):
+    # Deleting a book (or author) bumps every scope its reviews appear in, once rather than per review.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Book, Author):
+        return
+    book_ids = {instance.book_id}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None:
+        book_ids.add(previous[0])
+    invalidate_reviews([instance.pk], book_ids)
+
+
+def invalidate_reviews(review_ids, book_ids):
+    """Bump every scope that shows the given reviews or the aggregates of their books."""
+    author_ids = set(Book.objects.filter(id__in=book_ids).values_list('author_id', flat=True))
+    bump('books', 'reviews',
+         *(f'review:{review_id}' for review_id in review_ids),
+         *(f'book:{book_id}' for book_id in book_ids),
+         *(f'author:{author_id}' for author_id in author_ids))
+
+
+@receiver(post_save, sender=FullUser)
+def invalidate_user(sender, instance, created, update_fields=None, **kwargs):
+    # Review lists show the reviewer's username.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    book_ids = Review.objects.filter(user_id=instance.pk).values_list('book_id', flat=True).distinct()
+    bump('reviews', *(f'book:{book_id}' for book_id in book_ids))
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import hashlib
+
+from django.db.models import Count, Max, QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import condition
+
+from Backend.books.models import Author, Book, Review
+
+
+def conditional(get_validators):
+    """
+    Method decorator checking the preconditions of a write (If-Match,
+    If-Unmodified-Since) before the handler runs.
+
+    ``get_validators(request, **kwargs)`` returns the ``(etag, last_modified)``
+    of the resource, or ``(None, None)`` if it does not exist. It is looked up
+    once per request and shared by both checks.
+    """
+    def validators(request, **kwargs):
+        if not hasattr(request, '_validators'):
+            request._validators = get_validators(request, **kwargs)
+        return request._validators
+
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, **kwargs)[1],
+    ))
+
+
+def conditional_get(handler):
+    """
+    Answer If-None-Match and If-Modified-Since on a GET handler from the
+    validators of its response: the ones ``validated`` put on a response the
+    handler built, or the ones stored with a cached response, so a request
+    served from the cache is answered without a query. Works on both sync and
+    async handlers.
+    """
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(view, request, *args, **kwargs):
+            return not_modified(request, await handler(view, request, *args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        return not_modified(request, handler(view, request, *args, **kwargs))
+    return wrapper
+
+
+def validated(request, response, last_modified, *parts):
+    """Give a GET response built from rows last changed at ``last_modified`` its ETag and Last-Modified."""
+    response['ETag'] = quote_etag(make_etag(request, last_modified.isoformat(), *parts))
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified(request, response):
+    """``response``, or a 304 when the client already has the representation it validates."""
+    if not response.has_header('ETag'):
+        return response
+    last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+    return get_conditional_response(request, etag=response['ETag'], last_modified=last_modified,
+                                    response=response)
+
+
+def make_etag(request, *parts):
+    # GET representations differ per query string (pagination); writes target the resource itself.
+    query = request.META.get('QUERY_STRING', '') if request.method in ('GET', 'HEAD') else ''
+    raw = '|'.join([request.path, query] + [str(part) for part in parts])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def latest(*timestamps):
+    return max(t for t in timestamps if t is not None)
+
+
+def author_validators(request, author_id=None, **kwargs):
+    updated_at = Author.objects.filter(pk=author_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return make_etag(request, updated_at.isoformat()), updated_at
+
+
+def book_validators(request, book_id=None, **kwargs):
+    # Review writes and author renames touch the book, see touch_books.
+    updated_at = Book.objects.filter(pk=book_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return make_etag(request, updated_at.isoformat()), updated_at
+
+
+def author_books_state(author_id):
+    """
+    When the author or any of their books last changed and how many books they
+    have, or None. The reviews a list can embed (``?include=reviews``) are
+    covered too: their writes touch the book, see touch_books. Books that
+    leave the list, deleted or moved, touch the author, see touch_authors.
+    """
+    return (Author.objects.filter(pk=author_id)
+            .annotate(last_book=Max('books__updated_at'), books_count=Count('books'))
+            .values_list('updated_at', 'last_book', 'books_count').first())
+
+
+def review_validators(request, review_id=None, **kwargs):
+    row = Review.objects.filter(pk=review_id).values_list('updated_at', 'book__updated_at').first()
+    if row is None:
+        return None, None
+    last_modified = latest(*row)
+    return make_etag(request, last_modified.isoformat()), last_modified
+
+
+def touch_books(book_ids):
+    """Move the books' Last-Modified, for changes to what they show that are stored in other tables."""
+    Book.objects.filter(id__in=book_ids).update(updated_at=timezone.now())
+
+
+def touch_authors(author_ids):
+    """Move the Last-Modified of the authors' book lists, for books that left them."""
+    Author.objects.filter(id__in=author_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Author)
+def touch_author_books(sender, instance, created, raw=False, **kwargs):
+    # Books show their author's name.
+    if not created and not raw:
+        Book.objects.filter(author_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Book)
+def touch_previous_author(sender, instance, raw=False, **kwargs):
+    # Set by Backend.books.cache.remember_previous_author.
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if not raw and previous_author_id not in (None, instance.author_id):
+        touch_authors([previous_author_id])
+
+
+@receiver(post_delete, sender=Book)
+def touch_author_on_delete(sender, instance, origin=None, **kwargs):
+    # Nothing to touch when the author is being deleted with their books.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Author:
+        touch_authors([instance.author_id])
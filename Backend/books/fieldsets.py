@@ -0,0 +1,92 @@
+from collections import defaultdict
+
+from rest_framework.exceptions import ValidationError
+
+from Backend.books.compiled import author_list, book_list, book_review, review_list
+from Backend.books.models import Review
+
+
+def split(value):
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+class Fieldset:
+    """
+    The fields a catalog endpoint can return: the fields of a compiled plan
+    plus ``nested`` ones built by the view, some of them behind an opt-in
+    expansion. ``?include=`` picks the expansions (``default_include`` when it
+    is absent, which keeps the output of clients that do not ask) and
+    ``?fields=`` narrows the result. Only the columns of the selected fields
+    are read.
+    """
+
+    def __init__(self, plan, expansions=None, nested=()):
+        self.plan = plan
+        self.expansions = expansions or {}
+        self.nested = tuple(nested)
+
+    def select(self, request, default_include=()):
+        include = split(request.query_params.get('include'))
+        if include is None:
+            include = default_include
+        unknown = [name for name in include if name not in self.expansions]
+        if unknown:
+            raise ValidationError({'include': [f'Unknown expansion(s): {", ".join(unknown)}. '
+                                               f'Choose from: {", ".join(self.expansions) or "none"}.']})
+
+        excluded = {field for name, fields in self.expansions.items() if name not in include for field in fields}
+        available = [name for name in self.plan.field_names + list(self.nested) if name not in excluded]
+        fields = split(request.query_params.get('fields'))
+        if fields is None:
+            return available
+        unknown = [name for name in fields if name not in available]
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown or not included field(s): {", ".join(unknown)}. '
+                                              f'Available: {", ".join(available)}.']})
+        return [name for name in available if name in fields]
+
+    def values(self, queryset, fields, *extra):
+        return self.plan.narrow(fields).values(queryset, *extra)
+
+    def serialize(self, rows, fields):
+        return self.plan.narrow(fields).serialize(rows)
+
+
+AUTHOR = Fieldset(author_list)
+BOOK = Fieldset(book_list, {
+    'author': ('author_name',),
+    'rating_stats': ('review_count', 'rating_average', 'rating_histogram'),
+    'reviews': ('reviews',),
+}, nested=('reviews',))
+REVIEW = Fieldset(review_list, {'book': ('book_title',), 'user': ('creator',)})
+
+# What each endpoint returned before expansions were opt-in.
+BOOK_LIST_INCLUDE = ('author', 'rating_stats')
+BOOK_DETAIL_INCLUDE = ('author', 'rating_stats', 'reviews')
+REVIEW_LIST_INCLUDE = ('book', 'user')
+REVIEW_DETAIL_INCLUDE = ('book',)
+
+
+def streamable(fieldset, fields):
+    """The plan for a streamed export of ``fields``. Embedded lists are not streamed."""
+    nested = [name for name in fields if name in fieldset.nested]
+    if nested:
+        raise ValidationError({'include': [f'{", ".join(nested)} cannot be included in a streamed export.']})
+    return fieldset.plan.narrow(fields)
+
+
+def book_reviews(book_ids):
+    return book_review.values(Review.objects.filter(book_id__in=book_ids, status=Review.Status.APPROVED)
+                              .order_by('id'))
+
+
+def embed_reviews(data, rows, review_rows):
+    """Add the serialized ``review_rows`` to each book of ``data`` (serialized from ``rows``)."""
+    by_book = defaultdict(list)
+    for item in book_review.serialize(review_rows):
+        by_book[item['book']].append(item)
+    for item, row in zip(data, rows):
+        item['reviews'] = by_book[row['id']]
+    return data
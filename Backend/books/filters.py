@@ -0,0 +1,106 @@
+import datetime
+
+from rest_framework.exceptions import ValidationError
+
+from Backend.books.models import RATING_CHOICES
+
+
+# The range of an SQLite INTEGER: binding anything outside it raises OverflowError.
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+def integer(value):
+    value = int(value)
+    if not MIN_INTEGER <= value <= MAX_INTEGER:
+        raise ValueError
+    return value
+
+
+def iso_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def rating(value):
+    value = int(value)
+    if value not in dict(RATING_CHOICES):
+        raise ValueError
+    return value
+
+
+class ListFilter:
+    """
+    The query-string filters and orderings a list endpoint accepts.
+    ``filters`` maps a parameter to ``(lookup, parse)``; ``orderings`` maps the
+    values of ``?ordering=`` to keyset orderings (ending on a unique field),
+    the first one being the default. Orderings listed in ``requires`` are only
+    offered together with the given filter, the one that makes them indexed.
+
+    Every filter and ordering is backed by an index, see the models' Meta.
+    """
+
+    def __init__(self, filters, orderings, requires=None):
+        self.filters = filters
+        self.orderings = orderings
+        self.requires = requires or {}
+
+    def filter(self, queryset, request):
+        errors = {}
+        for name, (lookup, parse) in self.filters.items():
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: parse(value)})
+            except ValueError:
+                errors[name] = [f'Invalid value: {value}.']
+        if errors:
+            raise ValidationError(errors)
+        return queryset
+
+    def ordering(self, request, fixed=()):
+        """The ordering asked for by ``?ordering=``. ``fixed`` names the filters the URL already applies."""
+        name = request.query_params.get('ordering')
+        if name is None:
+            return next(iter(self.orderings.values()))
+        if name not in self.orderings:
+            raise ValidationError({'ordering': [f'Unknown ordering: {name}. '
+                                                f'Choose from: {", ".join(self.orderings)}.']})
+        required = self.requires.get(name)
+        if required and required not in fixed and required not in request.query_params:
+            raise ValidationError({'ordering': [f'ordering={name} needs the {required} filter.']})
+        return self.orderings[name]
+
+
+BOOKS = ListFilter(
+    filters={
+        'author': ('author_id', integer),
+        'published_after': ('publication_date__gte', iso_date),
+        'published_before': ('publication_date__lte', iso_date),
+    },
+    orderings={
+        'id': ('id',),
+        '-id': ('-id',),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+        'publication_date': ('publication_date', 'id'),
+        '-publication_date': ('-publication_date', '-id'),
+    },
+)
+REVIEWS = ListFilter(
+    filters={
+        'book': ('book_id', integer),
+        'user': ('user_id', integer),
+        'min_rating': ('rating__gte', rating),
+    },
+    orderings={
+        '-created_at': ('-created_at', '-id'),
+        'created_at': ('created_at', 'id'),
+        '-rating': ('-rating', '-id'),
+        'rating': ('rating', 'id'),
+    },
+    requires={'-rating': 'book', 'rating': 'book'},
+)
+LEADERBOARDS = ListFilter(
+    filters={'author': ('author_id', integer)},
+    orderings={'-score': ('-score', 'book_id')},
+)
@@ -0,0 +1,135 @@
+"""
+A durable job queue in the database. Work enqueued inside a write's
+transaction commits, or rolls back, with it; the run_workers command runs it.
+
+Tasks are plain functions of (target, payload) registered with ``@task``.
+Queued jobs of one task for the same target are coalesced into one, and a
+job enqueued with a ``key`` that was already used is dropped. A failing job
+is retried with exponential backoff, then marked failed.
+"""
+import datetime
+import logging
+import random
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from Backend.books.models import Job
+
+logger = logging.getLogger(__name__)
+
+tasks = {}
+
+
+def task(name):
+    def register(function):
+        tasks[name] = function
+        return function
+    return register
+
+
+def get_max_attempts():
+    return getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+
+
+def get_lease():
+    """How long a worker may hold a job before another one takes it over."""
+    return datetime.timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 300))
+
+
+def backoff(attempts):
+    base = getattr(settings, 'JOB_RETRY_DELAY_SECONDS', 5)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOB_MAX_RETRY_DELAY_SECONDS', 3600))
+    return datetime.timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def enqueue(name, target='', payload=None, key=None, delay=None):
+    """Queue one job. See ``enqueue_many``."""
+    enqueue_many(name, [target], payload, key=key, delay=delay)
+
+
+def enqueue_many(name, targets, payload=None, key=None, delay=None):
+    """
+    Queue ``name`` for each target, in one INSERT. Targets that already have
+    a queued job of the task are skipped, and so is everything when ``key``
+    was used before.
+    """
+    if name not in tasks:
+        raise ValueError(f'Unknown task: {name}')
+    run_at = timezone.now() + (delay or datetime.timedelta())
+    Job.objects.bulk_create([Job(task=name, target=str(target), payload=payload or {}, key=key, run_at=run_at)
+                             for target in targets], ignore_conflicts=True)
+
+
+def claim():
+    """Take the next due job, or one whose worker's lease ran out. Returns None when there is none."""
+    while True:
+        now = timezone.now()
+        job = (Job.objects.filter(Q(status=Job.Status.QUEUED, run_at__lte=now) |
+                                  Q(status=Job.Status.RUNNING, locked_until__lt=now))
+               .order_by('run_at', 'id').first())
+        if job is None:
+            return None
+        if job.status == Job.Status.RUNNING and job.attempts >= get_max_attempts():
+            # Every attempt ended with its worker gone (a crash, or a job outliving the lease).
+            Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+                status=Job.Status.FAILED, locked_until=None, updated_at=now,
+                last_error=f'The lease ran out on all {job.attempts} attempts.')
+            continue
+        # Another worker may have taken it since: only the update that still sees it wins.
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+            status=Job.Status.RUNNING, attempts=F('attempts') + 1, locked_until=now + get_lease(), updated_at=now)
+        if claimed:
+            job.status, job.attempts, job.locked_until = Job.Status.RUNNING, job.attempts + 1, now + get_lease()
+            return job
+
+
+def run(job):
+    """Run a claimed job and record the outcome."""
+    try:
+        with transaction.atomic():
+            tasks[job.task](job.target, job.payload)
+    except Exception:
+        logger.exception('Job %s %s(%s) failed (attempt %d)', job.pk, job.task, job.target, job.attempts)
+        fail(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.Status.DONE, locked_until=None, last_error='',
+                                         updated_at=timezone.now())
+    return True
+
+
+def fail(job, error):
+    now = timezone.now()
+    jobs = Job.objects.filter(pk=job.pk)
+    if job.attempts >= get_max_attempts() or job.task not in tasks:
+        jobs.update(status=Job.Status.FAILED, locked_until=None, last_error=error, updated_at=now)
+        return
+    try:
+        with transaction.atomic():
+            jobs.update(status=Job.Status.QUEUED, run_at=now + backoff(job.attempts), locked_until=None,
+                        last_error=error, updated_at=now)
+    except IntegrityError:
+        # A job for the same target was queued meanwhile and will do this work.
+        jobs.update(status=Job.Status.DONE, locked_until=None, last_error=error, updated_at=now)
+
+
+def run_pending(limit=None):
+    """Run due jobs in this thread until none is left (or ``limit`` ran). Returns the number run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+
+def prune(older_than=None):
+    """Delete finished jobs, forgetting their keys. Failed jobs are kept for inspection."""
+    older_than = older_than or datetime.timedelta(days=getattr(settings, 'JOB_KEEP_DAYS', 7))
+    return Job.objects.filter(status=Job.Status.DONE, updated_at__lt=timezone.now() - older_than).delete()[0]
+
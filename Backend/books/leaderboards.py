@@ -0,0 +1,144 @@
+import datetime
+import math
+from itertools import chain, groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, QuerySet, Subquery, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from Backend.books.cache import bump, get_cache
+from Backend.books.jobs import enqueue_many, task
+from Backend.books.models import Author, Book, BookRanking, Review
+
+PRIOR_KEY = 'books:leaderboards:prior'
+# Trending scores are stored as log2 of the review weights relative to this instant, so a score
+# computed now compares with one computed last week and never overflows.
+EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_prior_weight():
+    """How many reviews of the average rating every book starts with on the top-rated board."""
+    return getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', 10)
+
+
+def get_half_life():
+    return datetime.timedelta(days=getattr(settings, 'LEADERBOARD_TRENDING_HALF_LIFE_DAYS', 7))
+
+
+def get_window():
+    return datetime.timedelta(days=getattr(settings, 'LEADERBOARD_TRENDING_WINDOW_DAYS', 28))
+
+
+def prior_mean():
+    """The mean rating of all reviews, as of the last full refresh."""
+    mean = get_cache().get(PRIOR_KEY)
+    if mean is None:
+        mean = compute_prior_mean()
+        get_cache().set(PRIOR_KEY, mean, None)
+    return mean
+
+
+def compute_prior_mean():
+    totals = Book.objects.aggregate(reviews=Sum('review_count'), ratings=Sum('rating_sum'))
+    return totals['ratings'] / totals['reviews'] if totals['reviews'] else 0.0
+
+
+def bayesian_score(rating_sum, review_count, mean, weight):
+    return (weight * mean + rating_sum) / (weight + review_count)
+
+
+def half_lives(moment):
+    return (moment - EPOCH) / get_half_life()
+
+
+def trending_score(created_ats):
+    """log2 of the sum of 2 ** half_lives(created_at): the order of the decayed review counts at any time."""
+    exponents = [half_lives(created_at) for created_at in created_ats]
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (exponent - top) for exponent in exponents))
+
+
+def decayed_count(score, now=None):
+    """The review count of a trending score, each review weighing half as much every half-life."""
+    return 2 ** (score - half_lives(now or timezone.now()))
+
+
+def top_rated_rankings(book_ids=None):
+    books = Book.objects.filter(review_count__gte=getattr(settings, 'LEADERBOARD_MIN_REVIEWS', 1))
+    if book_ids is not None:
+        books = books.filter(id__in=book_ids)
+    mean, weight = prior_mean(), get_prior_weight()
+    for book_id, author_id, rating_sum, review_count in books.values_list(
+            'id', 'author_id', 'rating_sum', 'review_count').iterator(chunk_size=5000):
+        yield BookRanking(board=BookRanking.Board.TOP_RATED, book_id=book_id, author_id=author_id,
+                          score=bayesian_score(rating_sum, review_count, mean, weight))
+
+
+def trending_rankings(book_ids=None):
+    reviews = Review.objects.filter(status=Review.Status.APPROVED, created_at__gte=timezone.now() - get_window())
+    if book_ids is not None:
+        reviews = reviews.filter(book_id__in=book_ids)
+    rows = (reviews.order_by('book_id').values_list('book_id', 'book__author_id', 'created_at')
+            .iterator(chunk_size=5000))
+    for (book_id, author_id), group in groupby(rows, key=lambda row: row[:2]):
+        yield BookRanking(board=BookRanking.Board.TRENDING, book_id=book_id, author_id=author_id,
+                          score=trending_score([created_at for _, _, created_at in group]))
+
+
+def refresh_rankings(book_ids=None, batch_size=5000):
+    """
+    Recompute the leaderboards, or only the entries of ``book_ids``. A full
+    refresh also takes a new prior mean and lets reviews older than the
+    trending window drop out. Returns the number of ranked entries written.
+    """
+    if book_ids is None:
+        get_cache().set(PRIOR_KEY, compute_prior_mean(), None)
+    written = 0
+    with transaction.atomic():
+        stale = BookRanking.objects.all()
+        if book_ids is not None:
+            stale = stale.filter(book_id__in=book_ids)
+        stale.delete()
+        batch = []
+        for ranking in chain(top_rated_rankings(book_ids), trending_rankings(book_ids)):
+            batch.append(ranking)
+            if len(batch) >= batch_size:
+                written += len(BookRanking.objects.bulk_create(batch))
+                batch = []
+        written += len(BookRanking.objects.bulk_create(batch))
+    bump('leaderboards')
+    return written
+
+
+@receiver([post_save, post_delete], sender=Review)
+def refresh_rankings_on_review(sender, instance, origin=None, raw=False, **kwargs):
+    # Nothing to rank when the book (or its author) is being deleted.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if raw or origin_model in (Book, Author):
+        return
+    book_ids = {instance.book_id}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None:
+        book_ids.add(previous[0])
+    enqueue_many('refresh_rankings', book_ids)
+
+
+@task('refresh_rankings')
+def refresh_book_rankings(target, payload):
+    refresh_rankings([int(target)])
+
+
+@receiver(post_save, sender=Book)
+def move_rankings(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        BookRanking.objects.filter(book_id=instance.pk).exclude(author_id=instance.author_id).update(
+            author_id=instance.author_id)
+
+
+def move_book_rankings(book_ids):
+    """move_rankings for books written without signals (bulk upserts), in one UPDATE."""
+    BookRanking.objects.filter(book_id__in=book_ids).update(
+        author_id=Subquery(Book.objects.filter(id=OuterRef('book_id')).values('author_id')))
@@ -0,0 +1,179 @@
+import json
+import math
+import platform
+import re
+import statistics
+import threading
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import URLPattern, get_resolver
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Backend.books.models import FullUser, Author, Book, Review
+
+# Routes that are not read endpoints of the API.
+SKIPPED = {'login', 'token_obtain_pair', 'token_refresh', 'metrics', 'profile-list'}
+QUERIES = {'search': 'q=the', 'book-list': 'page_size=50', 'review-list': 'page_size=50',
+           'author-list': 'page_size=50', 'leaderboard': 'page_size=50'}
+PARAMETER_RE = re.compile(r'<(?:\w+:)?(\w+)>')
+QUERY_COUNT_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def routes(sample):
+    """(route, url name, path) for every URL pattern whose parameters ``sample`` can fill."""
+    found = []
+    for pattern in get_resolver().url_patterns:
+        if not isinstance(pattern, URLPattern) or pattern.name in SKIPPED or pattern.name is None:
+            continue
+        route = str(pattern.pattern)
+        names = PARAMETER_RE.findall(route)
+        if any(name not in sample for name in names):
+            continue
+        path = '/' + PARAMETER_RE.sub(lambda match: str(sample[match.group(1)]), route)
+        query = QUERIES.get(pattern.name)
+        found.append((route, pattern.name, f'{path}?{query}' if query else path))
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Drive every read route of the API in-process with concurrent clients and report throughput, '
+            'latency percentiles and query counts as JSON. With --baseline, compare against an earlier report '
+            'and fail on regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route.')
+        parser.add_argument('--route', action='append', help='URL names to run (default: all).')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='Keep the response cache on (by default every request reaches the views).')
+        parser.add_argument('--output', help='Also write the report to this file.')
+        parser.add_argument('--baseline', help='Report to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown of p95 and throughput (default: 0.25).')
+
+    def handle(self, *args, **options):
+        user = FullUser.objects.filter(is_active=True, is_staff=True).order_by('id').first() \
+            or FullUser.objects.filter(is_active=True).order_by('id').first()
+        book = Book.objects.filter(review_count__gt=0).order_by('-review_count', 'id').first()
+        if user is None or book is None:
+            raise CommandError('The database needs a user and a reviewed book (see seed_scale).')
+        review = Review.objects.filter(book=book, status=Review.Status.APPROVED).order_by('id').first()
+        sample = {'author_id': book.author_id, 'book_id': book.id, 'review_id': review.id, 'board': 'top-rated'}
+        token = str(RefreshToken.for_user(user).access_token)
+
+        selected = [route for route in routes(sample) if not options['route'] or route[1] in options['route']]
+        if not selected:
+            raise CommandError('No route to run.')
+        timeout = None if options['response_cache'] else 0
+        with override_settings(**({} if timeout is None else {'RESPONSE_CACHE_TIMEOUT': timeout})):
+            results = {route: self.run(name, path, token, options) for route, name, path in selected}
+        results = {route: result for route, result in results.items() if result is not None}
+
+        report = {
+            'environment': {
+                'python': platform.python_version(), 'django': django.get_version(),
+                'concurrency': options['concurrency'], 'requests': options['requests'],
+                'response_cache': options['response_cache'],
+                'dataset': {'authors': Author.objects.count(), 'books': Book.objects.count(),
+                            'reviews': Review.objects.count()},
+            },
+            'routes': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+        self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as stream:
+                baseline = json.load(stream)
+            regressions = self.compare(baseline['routes'], results, options['tolerance'])
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s):\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regression against the baseline.'))
+
+    def run(self, name, path, token, options):
+        def request(client):
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            match = QUERY_COUNT_RE.search(response.get('Server-Timing', ''))
+            return response.status_code, elapsed, int(match.group(1)) if match else None
+
+        def client():
+            return Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        def worker(count):
+            # Each thread has its own client and database connection.
+            try:
+                local = client()
+                samples.extend(request(local) for _ in range(count))
+            finally:
+                connections.close_all()
+
+        warm = client()
+        for _ in range(max(1, options['warmup'])):
+            status = request(warm)[0]
+        if status in (401, 403):
+            self.stderr.write(f'{name} {path}: skipped, the benchmark user may not read it.')
+            return None
+        samples = []
+        concurrency, total = options['concurrency'], options['requests']
+        started = time.perf_counter()
+        if concurrency > 1:
+            threads = [threading.Thread(target=worker, args=(total // concurrency + (i < total % concurrency),))
+                       for i in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            samples = [request(warm) for _ in range(total)]
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed for status, elapsed, _ in samples if status < 400)
+        queries = [count for status, _, count in samples if status < 400 and count is not None]
+        result = {
+            'name': name,
+            'path': path,
+            'requests': len(samples),
+            'errors': len(samples) - len(latencies),
+            'requests_per_second': round(len(latencies) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+            'queries': round(statistics.median(queries)) if queries else None,
+        }
+        self.stderr.write(f'{name} {path}: {result["requests_per_second"]} req/s, p95 {result["p95_ms"]} ms, '
+                          f'{result["queries"]} queries, {result["errors"]} errors')
+        return result
+
+    def compare(self, baseline, results, tolerance):
+        regressions = []
+        for route, result in results.items():
+            before = baseline.get(route)
+            if before is None:
+                continue
+            if result['errors'] > before['errors']:
+                regressions.append(f'{route}: {result["errors"]} errors (was {before["errors"]})')
+            if before['queries'] is not None and (result['queries'] or 0) > before['queries']:
+                regressions.append(f'{route}: {result["queries"]} queries (was {before["queries"]})')
+            if before['p95_ms'] and result['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{route}: p95 {result["p95_ms"]} ms (was {before["p95_ms"]} ms)')
+            if result['requests_per_second'] < before['requests_per_second'] * (1 - tolerance):
+                regressions.append(f'{route}: {result["requests_per_second"]} req/s '
+                                   f'(was {before["requests_per_second"]})')
+        return regressions
@@ -0,0 +1,80 @@
+import io
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Backend.books.models import FullUser, Book
+from Backend.books.renderers import ORJSONParser, ORJSONRenderer, orjson
+
+ENDPOINTS = {
+    'author-list': '/authors/?page_size={page_size}',
+    'book-list': '/books/?page_size={page_size}',
+    'review-list': '/reviews/?page_size={page_size}',
+    'book-detail': '/books/{book}/',
+}
+
+
+def measure(repeat, function):
+    """Best wall time over ``repeat`` runs, and the peak memory traced during one run."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak, result
+
+
+class Command(BaseCommand):
+    help = ('Compare render time and peak allocation of the stdlib and orjson renderers on the API '
+            'responses, and parse time of a batch review payload.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed: both renderers use the stdlib json module.')
+        user = FullUser.objects.order_by('id').first()
+        book = Book.objects.order_by('-review_count').first()
+        if user is None or book is None:
+            raise CommandError('The database needs at least one user and one book.')
+
+        factory = APIRequestFactory()
+        renderers = {'json': JSONRenderer(), 'orjson': ORJSONRenderer()}
+        results, responses = {}, {}
+        for name, url in ENDPOINTS.items():
+            request = factory.get(url.format(page_size=options['page_size'], book=book.id))
+            force_authenticate(request, user)
+            match = resolve(request.path)
+            data = responses[name] = match.func(request, *match.args, **match.kwargs).data
+
+            results[name] = {}
+            for renderer_name, renderer in renderers.items():
+                seconds, peak, body = measure(options['repeat'], lambda: renderer.render(data))
+                results[name][renderer_name] = {'ms': round(seconds * 1000, 3), 'peak_kib': round(peak / 1024, 1),
+                                                'bytes': len(body)}
+            results[name]['speedup'] = round(results[name]['json']['ms'] / results[name]['orjson']['ms'], 1)
+            self.stderr.write(f'{name}: {results[name]["speedup"]}x render')
+
+        items = [{key: review[key] for key in ('book', 'user', 'rating', 'review_text')}
+                 for review in responses['review-list']['results']]
+        body = json.dumps((items * (1000 // max(len(items), 1) + 1))[:1000]).encode()
+        results['review-batch-parse'] = {}
+        for parser_name, parser in (('json', JSONParser()), ('orjson', ORJSONParser())):
+            seconds, peak, _ = measure(options['repeat'], lambda: parser.parse(io.BytesIO(body)))
+            results['review-batch-parse'][parser_name] = {'ms': round(seconds * 1000, 3),
+                                                          'peak_kib': round(peak / 1024, 1), 'bytes': len(body)}
+        self.stdout.write(json.dumps(results, indent=2))
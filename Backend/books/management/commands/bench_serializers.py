@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from Backend.books.compiled import author_list, book_list, review_list
+from Backend.books.models import Author, Book, Review
+from Backend.books.serializers import AuthorSerializer, BookListSerializer, ReviewListSerializer
+
+CASES = {
+    'authors': (lambda: Author.objects.all(), AuthorSerializer, author_list),
+    'books': (lambda: Book.objects.select_related('author'), BookListSerializer, book_list),
+    'reviews': (lambda: Review.objects.select_related('book', 'user'), ReviewListSerializer, review_list),
+}
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+class Command(BaseCommand):
+    help = ('Compare ModelSerializer and compiled serialization of list rows, with and without the '
+            'query, and check both produce the same JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--case', choices=sorted(CASES), action='append', help='Lists to run (default: all).')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        render = JSONRenderer().render
+        results = {}
+        for name in options['case'] or sorted(CASES):
+            make_queryset, serializer_class, plan = CASES[name]
+            queryset = make_queryset().order_by('id')[:rows]
+            instances, values = list(queryset), list(plan.values(queryset))
+            if len(instances) < rows:
+                self.stderr.write(f'{name}: only {len(instances)} rows available, skipped '
+                                  f'(import_catalog can load a larger catalog).')
+                continue
+
+            drf, drf_data = best_of(repeat, lambda: serializer_class(instances, many=True).data)
+            compiled, compiled_data = best_of(repeat, lambda: plan.serialize(values))
+            if render(drf_data) != render(compiled_data):
+                raise CommandError(f'{name}: compiled output differs from {serializer_class.__name__}.')
+            drf_total, _ = best_of(repeat, lambda: serializer_class(list(queryset.all()), many=True).data)
+            compiled_total, _ = best_of(repeat, lambda: plan.serialize(list(plan.values(queryset.all()))))
+
+            results[name] = {
+                'rows': rows,
+                'serializer_rows_per_second': round(rows / drf),
+                'compiled_rows_per_second': round(rows / compiled),
+                'serialize_speedup': round(drf / compiled, 1),
+                'with_query_speedup': round(drf_total / compiled_total, 1),
+            }
+            self.stderr.write(f'{name}: {results[name]["serialize_speedup"]}x serialization, '
+                              f'{results[name]["with_query_speedup"]}x with the query')
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,134 @@
+import http.client
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Backend.books.models import FullUser, Book
+
+SERVERS = {
+    'wsgi': ['Backend.wsgi'],
+    'asgi': ['Backend.asgi', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+PATHS = ['/books/', '/reviews/', '/authors/', '/books/{book}/', '/author/{author}/books/']
+
+
+class Command(BaseCommand):
+    help = ('Run the API under gunicorn with sync (WSGI) and uvicorn (ASGI) workers on a copy of the '
+            'database and compare requests/s and latency at high concurrency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=15.0, help='Seconds per server.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--server', choices=sorted(SERVERS), action='append',
+                            help='Servers to run (default: all).')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='Keep the response cache on (by default every request reaches the views).')
+
+    def handle(self, *args, **options):
+        if shutil.which('gunicorn') is None:
+            raise CommandError('gunicorn is not installed.')
+        user = FullUser.objects.filter(is_active=True).order_by('id').first()
+        book = Book.objects.order_by('id').first()
+        if user is None or book is None:
+            raise CommandError('The database needs at least one user and one book.')
+        token = str(RefreshToken.for_user(user).access_token)
+        paths = [path.format(book=book.id, author=book.author_id) for path in PATHS]
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Path(tmp) / 'db.sqlite3'
+            shutil.copy(settings.DATABASES['default']['NAME'], database)
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE='Backend.settings', BOOKS_DB_PROFILE='production',
+                       BOOKS_SQLITE_PATH=str(database), BOOKS_CACHE_DIR=str(Path(tmp) / 'cache'))
+            if not options['response_cache']:
+                env['BOOKS_RESPONSE_CACHE_TIMEOUT'] = '0'
+
+            for name in options['server'] or sorted(SERVERS):
+                # The ASGI entry point switches to the async views itself.
+                server_env = dict(env, BOOKS_ASYNC_VIEWS='1' if name == 'asgi' else '0')
+                command = ['gunicorn', *SERVERS[name], '--workers', str(options['workers']),
+                           '--bind', f'127.0.0.1:{options["port"]}', '--log-level', 'warning']
+                server = subprocess.Popen(command, env=server_env, cwd=settings.BASE_DIR,
+                                          stdout=sys.stderr, stderr=sys.stderr)
+                try:
+                    self.wait_until_ready(server, options['port'], token, paths[0])
+                    results[name] = self.load(options, token, paths)
+                finally:
+                    server.terminate()
+                    server.wait()
+                self.stderr.write(f'{name}: {results[name]["requests_per_second"]:,.0f} req/s, '
+                                  f'p99 {results[name]["p99_ms"]:.1f} ms')
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def request(self, conn, token, path):
+        conn.request('GET', path, headers={'Authorization': f'Bearer {token}'})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def wait_until_ready(self, server, port, token, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and server.poll() is None:
+            try:
+                if self.request(http.client.HTTPConnection('127.0.0.1', port, timeout=5), token, path) == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'The server did not answer {path} with 200 within {timeout} seconds.')
+
+    def load(self, options, token, paths):
+        stop = threading.Event()
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+
+        def client():
+            conn = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=30)
+            local, failed = [], 0
+            while not stop.is_set():
+                path = f'{random.choice(paths)}?page_size={random.randint(10, 50)}'
+                started = time.perf_counter()
+                try:
+                    status = self.request(conn, token, path)
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', options['port'], timeout=30)
+                    status = None
+                if status == 200:
+                    local.append(time.perf_counter() - started)
+                else:
+                    failed += 1
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'requests_per_second': len(latencies) / options['duration'],
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None,
+            'errors': errors[0],
+        }
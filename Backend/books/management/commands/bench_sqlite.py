@@ -0,0 +1,157 @@
+import json
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+READ_SQL = """
+    SELECT r.id, r.rating, r.review_text, r.created_at, b.title, u.username
+    FROM books_review r
+    JOIN books_book b ON b.id = r.book_id
+    JOIN books_fulluser u ON u.id = r.user_id
+    WHERE r.status = 'approved'
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT 50
+"""
+WRITE_SQL = """
+    INSERT INTO books_review (book_id, user_id, rating, review_text, status, created_at, updated_at)
+    VALUES (?, ?, ?, ?, 'approved', strftime('%Y-%m-%d %H:%M:%f', 'now'), strftime('%Y-%m-%d %H:%M:%f', 'now'))
+"""
+
+PROFILES = {
+    # What the default settings do: rollback journal, no pragmas, one connection per request.
+    'default': {'journal_mode': 'DELETE', 'pragmas': {}, 'persistent': False},
+    # settings.py with BOOKS_DB_PROFILE=production; its pragmas are read from settings.SQLITE_PRAGMAS.
+    'production': {'journal_mode': 'WAL', 'pragmas': None, 'persistent': True},
+}
+
+
+def get_profile(name):
+    profile = PROFILES[name]
+    if profile['pragmas'] is None:
+        profile = dict(profile, pragmas=getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return profile
+
+
+class Command(BaseCommand):
+    help = ('Measure read throughput and latency under a steady write load, for the default '
+            'and the production SQLite profiles, on a copy of the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per profile.')
+        parser.add_argument('--writes-per-second', type=float, default=50.0)
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help='Profiles to run (default: all).')
+
+    def handle(self, *args, **options):
+        source = Path(settings.DATABASES['default']['NAME'])
+        if connections['default'].vendor != 'sqlite' or not source.exists():
+            raise CommandError('bench_sqlite needs an existing SQLite database.')
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in options['profile'] or sorted(PROFILES):
+                path = Path(tmp) / f'{name}.sqlite3'
+                shutil.copy(source, path)
+                profile = get_profile(name)
+                self.prepare(path, profile['journal_mode'])
+                results[name] = self.run(path, profile, options)
+                p99 = results[name]['read_p99_ms']
+                self.stderr.write(f'{name}: {results[name]["reads_per_second"]:,.0f} reads/s, '
+                                  f'p99 {"n/a" if p99 is None else f"{p99:.1f} ms"}')
+                for message in results[name]['error_messages']:
+                    self.stderr.write(self.style.ERROR(f'{name}: {message}'))
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def prepare(self, path, journal_mode):
+        db = sqlite3.connect(path)
+        db.execute(f'PRAGMA journal_mode = {journal_mode}')
+        if not db.execute('SELECT 1 FROM books_book LIMIT 1').fetchone():
+            db.execute("INSERT INTO books_author (name, bio, updated_at) VALUES ('Bench', '', '2020-01-01')")
+            db.execute("INSERT INTO books_book (title, author_id, publication_date, isbn, review_count, rating_sum,"
+                       " rating_histogram, updated_at) VALUES ('Bench', last_insert_rowid(), '2020-01-01',"
+                       " 'bench-isbn', 0, 0, '[0,0,0,0,0,0,0,0,0,0]', '2020-01-01')")
+        if not db.execute('SELECT 1 FROM books_fulluser LIMIT 1').fetchone():
+            db.execute("INSERT INTO books_fulluser (password, is_superuser, username, first_name, last_name, email,"
+                       " is_staff, is_active, date_joined, gender) VALUES ('', 0, 'bench', '', '', '', 0, 1,"
+                       " '2020-01-01', 'Other')")
+        db.commit()
+        db.close()
+
+    def connect(self, path, profile):
+        db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        for name, value in profile['pragmas'].items():
+            db.execute(f'PRAGMA {name} = {value}')
+        return db
+
+    def run(self, path, profile, options):
+        setup = sqlite3.connect(path)
+        book_id = setup.execute('SELECT id FROM books_book LIMIT 1').fetchone()[0]
+        user_id = setup.execute('SELECT id FROM books_fulluser LIMIT 1').fetchone()[0]
+        setup.close()
+
+        stop = threading.Event()
+        latencies, errors, writes, messages = [], [0], [0], set()
+        lock = threading.Lock()
+
+        def failed(kind, error):
+            with lock:
+                errors[0] += 1
+                messages.add(f'{kind} failed: {error}')
+
+        def reader():
+            db = self.connect(path, profile) if profile['persistent'] else None
+            local = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn = db or self.connect(path, profile)
+                    conn.execute(READ_SQL).fetchall()
+                    if db is None:
+                        conn.close()
+                    local.append(time.perf_counter() - started)
+                except sqlite3.Error as e:
+                    failed('read', e)
+            with lock:
+                latencies.extend(local)
+
+        def writer():
+            db = self.connect(path, profile)
+            interval = 1 / options['writes_per_second']
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    with db:
+                        db.execute(WRITE_SQL, (book_id, user_id, 5, 'benchmark review ' * 20))
+                    writes[0] += 1
+                except sqlite3.Error as e:
+                    failed('write', e)
+                time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader)
+                                                       for _ in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        return {
+            'reads': len(latencies),
+            'reads_per_second': len(latencies) / options['duration'],
+            'read_p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+            'read_p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None,
+            'writes': writes[0],
+            'errors': errors[0],
+            'error_messages': sorted(messages),
+        }
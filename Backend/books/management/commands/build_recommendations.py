@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Backend.books.recommendations import build_similarities
+
+
+class Command(BaseCommand):
+    help = ('Compute "readers who liked this also liked" neighbours of every book from the reviews '
+            '(item-item cosine similarity of mean-centred ratings) and store them for /books/<id>/similar/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbours', type=int, default=20, help='Neighbours kept per book.')
+        parser.add_argument('--min-reviews', type=int, default=2,
+                            help='Books with fewer reviews are not recommended.')
+        parser.add_argument('--memory', type=int, default=256,
+                            help='Megabytes for each block of the similarity matrix (default: 256).')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Reviews read per query.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        books, written = build_similarities(options['neighbours'], options['min_reviews'],
+                                            options['memory'] * 2 ** 20, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} neighbours for {books} books in {time.monotonic() - started:.2f}s'))
@@ -0,0 +1,239 @@
+import csv
+import datetime
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+
+from Backend.books.aggregates import rebuild_rating_aggregates
+from Backend.books.cache import bump
+from Backend.books.conditional import touch_authors
+from Backend.books.leaderboards import refresh_rankings
+from Backend.books.models import FullUser, Author, Book, Review, RATING_CHOICES
+
+RATINGS = {value for value, _ in RATING_CHOICES}
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def read_rows(path):
+    """Yield (line number, row dict) from a CSV or JSON-lines file without loading it whole."""
+    path = Path(path)
+    with path.open(newline='', encoding='utf-8') as stream:
+        if path.suffix.lower() == '.csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+        elif path.suffix.lower() in ('.jsonl', '.ndjson'):
+            for line_no, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, RejectedRow(f'Invalid JSON: {e}')
+                    continue
+                yield line_no, row if isinstance(row, dict) else RejectedRow('Expected a JSON object')
+        else:
+            raise CommandError(f'{path}: expected a .csv, .jsonl or .ndjson file')
+
+
+def required(row, name, max_length=None):
+    value = row.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    if value in (None, ''):
+        raise RejectedRow(f'{name} is required')
+    if max_length and len(str(value)) > max_length:
+        raise RejectedRow(f'{name} is longer than {max_length} characters')
+    return value
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Bulk import authors, books and reviews from CSV or JSON-lines files. '
+            'Books are upserted on ISBN; reviews reference books by ISBN and users by username.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', help='File with name, bio columns.')
+        parser.add_argument('--books', help='File with title, author, publication_date, isbn columns.')
+        parser.add_argument('--reviews', help='File with isbn, username, rating, review_text[, created_at] columns.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rejects', default='import_rejects.jsonl',
+                            help='Where rows that could not be imported are written.')
+        parser.add_argument('--progress-every', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        if not any(options[kind] for kind in ('authors', 'books', 'reviews')):
+            raise CommandError('Nothing to import: pass --authors, --books and/or --reviews.')
+
+        self.batch_size = options['batch_size']
+        self.progress_every = options['progress_every']
+        self.rejected = 0
+        self.touched_books = set()
+        self.touched_authors = set()
+        self.authors = dict(Author.objects.values_list('name', 'id'))
+
+        with open(options['rejects'], 'w', encoding='utf-8') as self.rejects:
+            for kind, import_batch in (('authors', self.import_authors), ('books', self.import_books),
+                                       ('reviews', self.import_reviews)):
+                if options[kind]:
+                    self.run(kind, options[kind], import_batch)
+
+        touched = sorted(self.touched_books)
+        if touched:
+            self.stdout.write('Refreshing rating aggregates...')
+        for start in range(0, len(touched), self.batch_size):
+            chunk = touched[start:start + self.batch_size]
+            rebuild_rating_aggregates(book_ids=chunk)
+            refresh_rankings(chunk)
+            self.touched_authors.update(Book.objects.filter(id__in=chunk).values_list('author_id', flat=True))
+        bump('authors', 'books', 'reviews', *(f'author:{author_id}' for author_id in self.touched_authors),
+             *(f'book:{book_id}' for book_id in touched))
+
+        if self.rejected:
+            self.stdout.write(self.style.WARNING(f'{self.rejected} rows rejected, see {options["rejects"]}'))
+
+    def run(self, kind, path, import_batch):
+        started = time.monotonic()
+        imported = seen = 0
+        next_report = self.progress_every
+        for batch in batched(read_rows(path), self.batch_size):
+            rows = []
+            for line_no, row in batch:
+                if isinstance(row, RejectedRow):
+                    self.reject(path, line_no, None, row)
+                else:
+                    rows.append((line_no, row))
+            with transaction.atomic():
+                imported += import_batch(path, rows)
+            seen += len(batch)
+            if seen >= next_report:
+                next_report += self.progress_every
+                self.report(kind, seen, imported, started)
+        self.report(kind, seen, imported, started, done=True)
+
+    def report(self, kind, seen, imported, started, done=False):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        message = f'{kind}: {seen} rows read, {imported} imported, {seen / elapsed:,.0f} rows/s'
+        self.stdout.write(self.style.SUCCESS(message) if done else message)
+
+    def reject(self, path, line_no, row, error):
+        self.rejected += 1
+        self.rejects.write(json.dumps({'file': str(path), 'line': line_no, 'row': row, 'error': str(error)},
+                                      default=str) + '\n')
+
+    def validated(self, path, rows, clean):
+        for line_no, row in rows:
+            try:
+                yield clean(row)
+            except RejectedRow as e:
+                self.reject(path, line_no, row, e)
+
+    def create_authors(self, authors):
+        new = [author for name, author in authors.items() if name not in self.authors]
+        for author in Author.objects.bulk_create(new, batch_size=self.batch_size):
+            self.authors[author.name] = author.id
+            self.touched_authors.add(author.id)
+        return len(new)
+
+    def import_authors(self, path, rows):
+        def clean(row):
+            return Author(name=required(row, 'name', 100), bio=row.get('bio') or '')
+
+        return self.create_authors({author.name: author for author in self.validated(path, rows, clean)})
+
+    def import_books(self, path, rows):
+        def clean(row):
+            try:
+                publication_date = parse_date(str(required(row, 'publication_date')))
+            except ValueError:
+                publication_date = None
+            if publication_date is None:
+                raise RejectedRow('publication_date must be YYYY-MM-DD')
+            return required(row, 'author', 100), Book(title=required(row, 'title', 200),
+                                                      isbn=str(required(row, 'isbn', 17)),
+                                                      publication_date=publication_date)
+
+        # Last row wins when an ISBN repeats inside the batch, as it does across batches.
+        books = {book.isbn: (author, book) for author, book in self.validated(path, rows, clean)}
+        self.create_authors({author: Author(name=author, bio='') for author, _ in books.values()})
+        # Books moved to another author also leave their previous author's list.
+        previous = dict(Book.objects.filter(isbn__in=books).values_list('isbn', 'author_id'))
+        self.touched_authors.update(previous.values())
+        for author, book in books.values():
+            book.author_id = self.authors[author]
+            self.touched_authors.add(book.author_id)
+        touch_authors({previous[isbn] for isbn, (_, book) in books.items()
+                       if previous.get(isbn, book.author_id) != book.author_id})
+        Book.objects.bulk_create([book for _, book in books.values()], batch_size=self.batch_size,
+                                 update_conflicts=True, unique_fields=['isbn'],
+                                 update_fields=['title', 'author', 'publication_date', 'updated_at'])
+        # Upserted rows come back without primary keys on SQLite.
+        self.touched_books.update(Book.objects.filter(isbn__in=books).values_list('id', flat=True))
+        return len(books)
+
+    def import_reviews(self, path, rows):
+        valid = []
+        for line_no, row in rows:
+            try:
+                rating = int(required(row, 'rating'))
+                if rating not in RATINGS:
+                    raise ValueError
+            except (TypeError, ValueError):
+                self.reject(path, line_no, row, 'rating must be an integer from 1 to 10')
+                continue
+            try:
+                valid.append((line_no, row, str(required(row, 'isbn')), str(required(row, 'username')), rating))
+            except RejectedRow as e:
+                self.reject(path, line_no, row, e)
+
+        book_ids = dict(Book.objects.filter(isbn__in={r[2] for r in valid}).values_list('isbn', 'id'))
+        user_ids = dict(FullUser.objects.filter(username__in={r[3] for r in valid}).values_list('username', 'id'))
+
+        reviews, created_at = [], []
+        for line_no, row, isbn, username, rating in valid:
+            if isbn not in book_ids:
+                self.reject(path, line_no, row, f'unknown isbn {isbn}')
+                continue
+            if username not in user_ids:
+                self.reject(path, line_no, row, f'unknown username {username}')
+                continue
+            try:
+                timestamp = parse_datetime(str(row['created_at'])) if row.get('created_at') else None
+            except ValueError:
+                timestamp = None
+            if timestamp is not None and timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp, datetime.timezone.utc)
+            # Imported reviews were published already, they skip moderation.
+            reviews.append(Review(book_id=book_ids[isbn], user_id=user_ids[username], rating=rating,
+                                  review_text=row.get('review_text') or '', status=Review.Status.APPROVED))
+            created_at.append(timestamp)
+
+        Review.objects.bulk_create(reviews, batch_size=self.batch_size)
+        self.touched_books.update(review.book_id for review in reviews)
+
+        # created_at is auto_now_add, so historical timestamps are written after the insert.
+        backdated = [(connection.ops.adapt_datetimefield_value(ts), review.id)
+                     for review, ts in zip(reviews, created_at) if ts is not None]
+        if backdated:
+            table = connection.ops.quote_name(Review._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(f'UPDATE {table} SET created_at = %s WHERE id = %s', backdated)
+        return len(reviews)
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Backend.books.aggregates import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored review count, rating sum and histogram of every book.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates for {updated} reviewed books in {time.monotonic() - started:.2f}s'))
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Backend.books.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over authors, books and reviews.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        documents = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {documents} documents in {time.monotonic() - started:.2f}s'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Backend.books.leaderboards import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = ('Recompute the top-rated and trending leaderboards: a new prior mean for the top-rated scores, and '
+            'reviews that left the trending window dropped. Run it periodically, e.g. hourly from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = refresh_rankings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {written} leaderboard entries in {time.monotonic() - started:.2f}s'))
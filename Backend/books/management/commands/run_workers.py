@@ -0,0 +1,68 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from Backend.books import jobs
+from Backend.books.cache import is_shared
+
+
+class Command(BaseCommand):
+    help = ('Run the queued background jobs (rating aggregates, leaderboards) with a pool of worker threads. '
+            'Stops on SIGINT/SIGTERM once the jobs in progress are done.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='0 runs the jobs in the main thread.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between looks at an empty queue.')
+        parser.add_argument('--once', action='store_true', help='Run the due jobs, then exit.')
+        parser.add_argument('--local-cache', action='store_true',
+                            help='Run with a response cache private to this process, which the web '
+                                 'processes never see the invalidations of.')
+
+    def handle(self, *args, **options):
+        # Jobs expire cached responses by bumping cache versions: the web processes must see them.
+        if not is_shared() and not options['local_cache']:
+            raise CommandError('The response cache is local to each process. Set BOOKS_CACHE_DIR to a '
+                               'directory shared with the web processes (or pass --local-cache).')
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: self.stopping.set())
+        self.ran = 0
+        self.lock = threading.Lock()
+        jobs.prune()
+
+        started = time.monotonic()
+        self.threaded = options['threads'] > 0
+        if self.threaded:
+            threads = [threading.Thread(target=self.work_thread, args=(options,), name=f'job-worker-{i}')
+                       for i in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            self.work(options)
+        self.stdout.write(self.style.SUCCESS(f'Ran {self.ran} jobs in {time.monotonic() - started:.2f}s'))
+
+    def work_thread(self, options):
+        # Each thread has its own database connection.
+        try:
+            self.work(options)
+        finally:
+            connections.close_all()
+
+    def work(self, options):
+        while not self.stopping.is_set():
+            if self.threaded:
+                close_old_connections()
+            ran = jobs.run_pending(limit=100)
+            with self.lock:
+                self.ran += ran
+            if not ran:
+                if options['once']:
+                    break
+                self.stopping.wait(options['poll_interval'])
@@ -0,0 +1,158 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from Backend.books.aggregates import rebuild_rating_aggregates
+from Backend.books.cache import bump
+from Backend.books.leaderboards import refresh_rankings
+from Backend.books.models import FullUser, Author, Book, BookRanking, BookSimilarity, Job, Review
+from Backend.books.search import drop_search_triggers, install_search_triggers, rebuild_search_index
+
+FIRST_NAMES = ['Ada', 'Bruno', 'Chloe', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jonas', 'Kaito',
+               'Lina', 'Marco', 'Nadia', 'Oskar', 'Priya', 'Quentin', 'Rosa', 'Sami', 'Tove', 'Umar', 'Vera']
+LAST_NAMES = ['Adler', 'Berg', 'Costa', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Horvat', 'Ivanova', 'Jansen',
+              'Kowalski', 'Laine', 'Moreau', 'Novak', 'Okafor', 'Petrov', 'Rossi', 'Silva', 'Tanaka', 'Varga']
+ADJECTIVES = ['Silent', 'Broken', 'Golden', 'Hidden', 'Last', 'Northern', 'Quiet', 'Red', 'Secret', 'Wild',
+              'Distant', 'Burning', 'Glass', 'Iron', 'Lost', 'Paper', 'Salt', 'Winter', 'Velvet', 'Hollow']
+NOUNS = ['River', 'Garden', 'Empire', 'Letters', 'Harbor', 'Orchard', 'Machine', 'Forest', 'Kingdom', 'Sea',
+         'Station', 'Mirror', 'Archive', 'Island', 'Lantern', 'Tower', 'Bridge', 'Season', 'Hours', 'Map']
+OPINIONS = {
+    'low': ['Could not finish it.', 'Flat characters and a slow plot.', 'Not for me.'],
+    'mid': ['Decent, with some slow chapters.', 'Good ideas, uneven execution.', 'An easy read.'],
+    'high': ['Loved every page.', 'Beautifully written.', 'One of the best books I read this year.'],
+}
+# Reviews are dated over the five years from this day.
+FIRST_REVIEW_DAY = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+REVIEW_DAYS = 5 * 365
+
+
+def isbn13(number):
+    """A valid ISBN-13 in the 978 prefix for a number below 10**9."""
+    digits = f'978{number:09d}'
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits))
+    return digits + str(-total % 10)
+
+
+def book_rating(rng, quality):
+    """A 1-10 rating around a book's quality, skewed high like real review sites."""
+    return min(10, max(1, round(rng.gauss(1 + 9 * quality, 1.8))))
+
+
+class Command(BaseCommand):
+    help = ('Generate a deterministic synthetic catalog: users, authors, books with valid unique ISBNs, and '
+            'reviews spread over books by popularity with realistic rating distributions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=100000)
+        parser.add_argument('--users', type=int, help='Default: one user per 20 reviews, at least 10.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete the existing catalog and seeded users first.')
+
+    def handle(self, *args, **options):
+        authors, books, reviews = options['authors'], options['books'], options['reviews']
+        users = options['users'] or max(10, reviews // 20)
+        if min(authors, books, users) < 1 or reviews < 0:
+            raise CommandError('--authors, --books and --users must be positive.')
+        if books >= 10 ** 9:
+            raise CommandError('At most 999,999,999 books can get an ISBN.')
+        if not options['flush'] and (Book.objects.exists()
+                                     or FullUser.objects.filter(username__startswith='seed-').exists()):
+            raise CommandError('The database already has a catalog; pass --flush to replace it.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        # The search index is rebuilt in one pass at the end rather than row by row.
+        drop_search_triggers()
+        try:
+            if options['flush']:
+                self.flush()
+            user_ids = self.create_users(users)
+            author_ids = self.create_authors(authors)
+            book_ids, qualities = self.create_books(books, author_ids)
+            self.create_reviews(reviews, book_ids, qualities, user_ids)
+        finally:
+            install_search_triggers()
+        rebuild_search_index()
+        rebuild_rating_aggregates()
+        refresh_rankings()
+        bump('authors', 'books', 'reviews')
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {users} users, {authors} authors, {books} books and {reviews} reviews '
+            f'in {time.monotonic() - started:.1f}s.'))
+
+    def flush(self):
+        # Plain DELETEs: QuerySet.delete() would send a signal, and refresh aggregates, per row.
+        quote = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Queued jobs target rows of the old catalog.
+            for model in (Job, BookRanking, BookSimilarity, Review, Book, Author):
+                cursor.execute(f'DELETE FROM {quote(model._meta.db_table)}')
+            cursor.execute(f'DELETE FROM {quote(FullUser._meta.db_table)} WHERE username LIKE %s', ['seed-%'])
+
+    def insert(self, model, objects):
+        """Bulk insert ``objects`` and return their ids in order."""
+        ids = []
+        for start in range(0, len(objects), self.batch_size):
+            with transaction.atomic():
+                ids += [obj.pk for obj in model.objects.bulk_create(objects[start:start + self.batch_size])]
+        return ids
+
+    def create_users(self, count):
+        genders = [choice for choice, _ in FullUser.Gender.choices]
+        return self.insert(FullUser, [
+            FullUser(username=f'seed-{i}', password='!', email=f'seed-{i}@example.com',
+                     first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                     gender=self.rng.choice(genders))
+            for i in range(count)])
+
+    def create_authors(self, count):
+        names = [f'{first} {last}' for first, last in itertools.product(FIRST_NAMES, LAST_NAMES)]
+        return self.insert(Author, [
+            Author(name=f'{self.rng.choice(names)} {i}' if i >= len(names) else names[i],
+                   bio=f'Writes about {self.rng.choice(NOUNS).lower()}s and {self.rng.choice(NOUNS).lower()}s.')
+            for i in range(count)])
+
+    def create_books(self, count, author_ids):
+        books, qualities = [], []
+        for i in range(count):
+            books.append(Book(
+                title=f'The {self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}',
+                author_id=self.rng.choice(author_ids),
+                publication_date=datetime.date(1950, 1, 1) + datetime.timedelta(days=self.rng.randrange(27000)),
+                isbn=isbn13(i),
+            ))
+            qualities.append(self.rng.betavariate(5, 2))
+        return self.insert(Book, books), qualities
+
+    def create_reviews(self, count, book_ids, qualities, user_ids):
+        # Popularity follows a Zipf-like law over a shuffled order of the books.
+        order = list(range(len(book_ids)))
+        self.rng.shuffle(order)
+        weights = list(itertools.accumulate(1 / (rank + 1) ** 0.9 for rank in range(len(order))))
+        # Reviews are inserted with plain SQL: they are most of the rows, created_at is
+        # auto_now_add, and the aggregates are rebuilt once at the end anyway.
+        columns = ('book_id', 'user_id', 'rating', 'review_text', 'status', 'created_at', 'updated_at')
+        sql = (f'INSERT INTO {connection.ops.quote_name(Review._meta.db_table)} ({", ".join(columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))})')
+        for start in range(0, count, self.batch_size):
+            rows = []
+            for rank in self.rng.choices(range(len(order)), cum_weights=weights,
+                                         k=min(self.batch_size, count - start)):
+                book = order[rank]
+                rating = book_rating(self.rng, qualities[book])
+                tone = 'low' if rating <= 4 else 'mid' if rating <= 7 else 'high'
+                created_at = connection.ops.adapt_datetimefield_value(
+                    FIRST_REVIEW_DAY + datetime.timedelta(seconds=self.rng.randrange(REVIEW_DAYS * 86400)))
+                rows.append((book_ids[book], self.rng.choice(user_ids), rating, self.rng.choice(OPINIONS[tone]),
+                             Review.Status.APPROVED, created_at, created_at))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
@@ -0,0 +1,168 @@
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_QUERIES = 5
+# Request methods get a series of their own, any other method is counted as 'other'.
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+# The metrics of the request being served. Set by InstrumentationMiddleware;
+# sync_to_async copies it into the threads that run the ORM for async views.
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.slowest = []  # min-heap of (seconds, sql)
+        self.query_log = None  # every (sql, seconds), when a profiler asks for it
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_time += seconds
+        if self.query_log is not None:
+            self.query_log.append((sql, seconds))
+        if len(self.slowest) < SLOWEST_QUERIES:
+            heapq.heappush(self.slowest, (seconds, sql))
+        else:
+            heapq.heappushpop(self.slowest, (seconds, sql))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        return (f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+                f'serialize;dur={self.serialize_time * 1000:.2f}, total;dur={total * 1000:.2f}')
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    """Count the time spent in the block as serialization, minus the queries it runs."""
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    started, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started - (metrics.db_time - db_time)
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+
+def label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Registry:
+    """Per-route request statistics of this process, in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, method, metrics, total):
+        bucket = next((i for i, bound in enumerate(BUCKETS) if total <= bound), len(BUCKETS))
+        method = method if method in METHODS else 'other'
+        with self._lock:
+            stats = self._routes.setdefault((route, method), RouteStats())
+            stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.total += total
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.serialize_time += metrics.serialize_time
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = ['# HELP books_request_duration_seconds Time spent serving requests, by URL name.',
+                     '# TYPE books_request_duration_seconds histogram']
+            for (route, method), stats in routes:
+                labels = f'route="{label(route)}",method="{label(method)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += count
+                    lines.append(f'books_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'books_request_duration_seconds_sum{{{labels}}} {stats.total}')
+                lines.append(f'books_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+            for name, attribute, help_text in (
+                    ('books_request_db_queries_total', 'queries', 'SQL queries run while serving requests.'),
+                    ('books_request_db_seconds_total', 'db_time', 'Time spent in SQL queries.'),
+                    ('books_request_serialize_seconds_total', 'serialize_time',
+                     'Time spent serializing and rendering.')):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (route, method), stats in routes:
+                    lines.append(f'{name}{{route="{label(route)}",method="{label(method)}"}} '
+                                 f'{getattr(stats, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route
+
+
+def finish_request(request, response, metrics):
+    """Add the Server-Timing header, record the request, and log it if it was slow."""
+    total = metrics.elapsed()
+    response['Server-Timing'] = metrics.server_timing(total)
+    route = route_name(request)
+    registry.observe(route, request.method, metrics, total)
+    if total >= getattr(settings, 'SLOW_REQUEST_THRESHOLD', 1.0):
+        slowest = sorted(metrics.slowest, reverse=True)
+        queries = ''.join(f'\n  {seconds * 1000:.1f} ms  {sql}' for seconds, sql in slowest)
+        logger.warning('Slow request: %s %s (%s) took %.1f ms, %d queries in %.1f ms, serialization %.1f ms.'
+                       '\nSlowest queries:%s', request.method, request.get_full_path(), route, total * 1000,
+                       metrics.queries, metrics.db_time * 1000, metrics.serialize_time * 1000, queries or ' none')
+    return response
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from Backend.books.cache import store_variant
+from Backend.books.compression import compress, compress_stream, get_min_size, is_compressible, negotiate
+from Backend.books.metrics import RequestMetrics, current, finish_request
+from Backend.books.profiling import PROFILE_HEADER, RequestProfile, profile_trigger
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """
+    Measure each request: SQL queries and their time, serialization time and
+    total time. They are sent back in a Server-Timing header, added to the
+    per-route histograms served on /metrics/ and logged with the slowest
+    queries when the request takes longer than ``SLOW_REQUEST_THRESHOLD``
+    seconds. The body of a streamed export is not part of the timings.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return finish_request(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return finish_request(request, response, metrics)
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Sample the stack of the thread running the view for staff requests sending
+    an ``X-Profile`` header, and for a ``PROFILE_SAMPLE_RATE`` share of all
+    requests. Profiles are stored with the request's query log and timings
+    (Backend.books.profiling). Requests that are not profiled only pay for a
+    header lookup.
+
+    Async views are sampled on the event loop thread, where the samples may
+    include other requests' coroutines, and on the request's thread-sensitive
+    executor thread, which runs their ORM calls and rendering.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        trigger = profile_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        profile = RequestProfile(trigger, [threading.get_ident()])
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        profile.save(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if PROFILE_HEADER not in request.META and not getattr(settings, 'PROFILE_SAMPLE_RATE', 0):
+            return await self.get_response(request)
+        trigger = await sync_to_async(profile_trigger)(request)
+        if trigger is None:
+            return await self.get_response(request)
+        profile = RequestProfile(trigger, [threading.get_ident(), await sync_to_async(threading.get_ident)()])
+        profile.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        await sync_to_async(profile.save)(request, response)
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress JSON and NDJSON responses in the best coding the client accepts
+    (brotli or zstd when installed, else gzip). Bodies under
+    ``COMPRESSION_MIN_SIZE`` bytes are sent as is, streamed exports are
+    compressed chunk by chunk, and the compressed body of a freshly cached
+    response is cached next to it so later hits skip rendering and compression.
+
+    ETags are left as they are: they validate the resource, and weakening them
+    would make If-Match fail for clients that accept compression.
+    """
+
+    def process_response(self, request, response):
+        if not is_compressible(response.get('Content-Type', '')):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.has_header('Content-Encoding'):
+            return response
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if len(response.content) < get_min_size():
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+            if response.status_code == 200 and getattr(response, 'cache_key', None):
+                store_variant(response.cache_key, response, encoding)
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,16 @@
+# Generated by Django 4.1.7 on 2026-10-18 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0003_alter_review_rating"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["created_at", "id"], name="review_created_id_idx"),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 03:15
+
+import Backend.books.models
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Review = apps.get_model("books", "Review")
+    histograms = {}
+    grouped = Review.objects.values_list("book_id", "rating").annotate(n=Count("id"))
+    for book_id, rating, n in grouped.order_by():
+        histograms.setdefault(book_id, [0] * 10)[rating - 1] = n
+    for book_id, histogram in histograms.items():
+        Book.objects.filter(pk=book_id).update(
+            review_count=sum(histogram),
+            rating_sum=sum(r * n for r, n in enumerate(histogram, start=1)),
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0004_review_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_histogram",
+            field=models.JSONField(default=Backend.books.models.empty_rating_histogram, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
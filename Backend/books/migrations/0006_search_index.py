@@ -0,0 +1,46 @@
+# Full-text search index over authors, books and reviews (SQLite FTS5).
+#
+# Every document is stored under rowid = object id * 4 + kind (1 author, 2 book,
+# 3 review). The triggers that keep it in sync are (re)installed after every
+# migrate by Backend.books.search.install_search_triggers, because SQLite drops
+# them whenever a migration rebuilds one of the catalog tables.
+
+from django.db import migrations
+
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE books_search USING fts5(
+        title, body, tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    "INSERT INTO books_search(books_search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    "INSERT INTO books_search(rowid, title, body) SELECT id * 4 + 1, name, bio FROM books_author",
+    "INSERT INTO books_search(rowid, title, body) SELECT id * 4 + 2, title, '' FROM books_book",
+    "INSERT INTO books_search(rowid, title, body) SELECT id * 4 + 3, '', review_text FROM books_review",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS books_search_%s_%s" % (table, action)
+    for table in ("author", "book", "review")
+    for action in ("ai", "au", "ad")
+] + ["DROP TABLE IF EXISTS books_search"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0005_book_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD_SQL), run(REVERSE_SQL)),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0008_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookRanking",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("board", models.CharField(choices=[("top-rated", "Top Rated"), ("trending", "Trending")], max_length=10)),
+                ("score", models.FloatField()),
+                ("author", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="books.author")),
+                ("book", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="rankings", to="books.book")),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="bookranking",
+            index=models.Index(fields=["board", "-score", "book"], name="ranking_board_score_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookranking",
+            index=models.Index(fields=["board", "author", "-score", "book"], name="ranking_author_score_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="bookranking",
+            constraint=models.UniqueConstraint(fields=("board", "book"), name="ranking_board_book_uniq"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0009_book_ranking"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSimilarity",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.FloatField()),
+                ("book", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="books.book")),
+                ("similar", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="neighbour_of", to="books.book")),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="booksimilarity",
+            index=models.Index(fields=["book", "-score"], name="similarity_book_score_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="booksimilarity",
+            constraint=models.UniqueConstraint(fields=("book", "similar"), name="similarity_book_similar_uniq"),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+CHOICES = [("pending", "Pending"), ("approved", "Approved"), ("rejected", "Rejected")]
+
+
+def drop_review_search_triggers(apps, schema_editor):
+    # Only approved reviews are indexed now; post_migrate installs the new triggers.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for action in ("ai", "au", "ad"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS books_search_review_%s" % action)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0011_job"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="review",
+            name="review_created_id_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="review",
+            name="review_book_created_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="review",
+            name="review_user_created_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="review",
+            name="review_book_rating_idx",
+        ),
+        migrations.AddField(
+            model_name="review",
+            name="status",
+            # The existing reviews were published before moderation.
+            field=models.CharField(choices=CHOICES, default="approved", max_length=8),
+        ),
+        migrations.AlterField(
+            model_name="review",
+            name="status",
+            field=models.CharField(choices=CHOICES, default="pending", max_length=8),
+        ),
+        migrations.RunPython(drop_review_search_triggers, drop_review_search_triggers),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "approved")), fields=["created_at", "id"], name="review_created_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "approved")), fields=["book", "created_at"], name="review_book_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "approved")), fields=["user", "created_at"], name="review_user_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "approved")), fields=["book", "rating"], name="review_book_rating_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "pending")), fields=["created_at", "id"], name="review_pending_idx"),
+        ),
+    ]
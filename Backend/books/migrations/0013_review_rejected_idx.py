@@ -0,0 +1,16 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0012_review_moderation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(condition=models.Q(("status", "rejected")), fields=["id"], name="review_rejected_idx"),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+RATING_CHOICES = [(i, i) for i in range(1, 11)]
 
 
 class FullUser(AbstractUser):
@@ -12,31 +15,163 @@ class FullUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None):
+        # Users built from token claims defer most fields; load them together on first access.
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using, fields)
+
 
 class Author(models.Model):
     name = models.CharField(max_length=100)
     bio = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
+def empty_rating_histogram():
+    return [0] * len(RATING_CHOICES)
+
+
+def average_rating(rating_sum, review_count):
+    if not review_count:
+        return None
+    return round(rating_sum / review_count, 2)
+
+
 class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='books')
     publication_date = models.DateField()
     isbn = models.CharField(max_length=17, unique=True)
+    # Rating aggregates, maintained by Backend.books.aggregates whenever a review is written.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_histogram = models.JSONField(default=empty_rating_histogram, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'publication_date'], name='book_author_published_idx'),
+            models.Index(fields=['publication_date'], name='book_published_idx'),
+            models.Index(fields=['title'], name='book_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def rating_average(self):
+        return average_rating(self.rating_sum, self.review_count)
+
 
 class Review(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        APPROVED = 'approved'
+        REJECTED = 'rejected'
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(FullUser, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.PositiveIntegerField(choices=[(i, i) for i in range(1, 11)])
+    rating = models.PositiveIntegerField(choices=RATING_CHOICES)
     review_text = models.TextField()
+    # Only approved reviews are shown, counted in the book's aggregates and searchable.
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Partial indexes: the public lists only read approved reviews, the moderation queue only pending ones.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='review_created_id_idx',
+                         condition=models.Q(status='approved')),
+            models.Index(fields=['book', 'created_at'], name='review_book_created_idx',
+                         condition=models.Q(status='approved')),
+            models.Index(fields=['user', 'created_at'], name='review_user_created_idx',
+                         condition=models.Q(status='approved')),
+            models.Index(fields=['book', 'rating'], name='review_book_rating_idx',
+                         condition=models.Q(status='approved')),
+            models.Index(fields=['created_at', 'id'], name='review_pending_idx', condition=models.Q(status='pending')),
+            # The admin's status filter; the other statuses have theirs above.
+            models.Index(fields=['id'], name='review_rejected_idx', condition=models.Q(status='rejected')),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keeps the row and the book's rating aggregates in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Review of {self.book.title} by {self.user}"
+
+
+class BookRanking(models.Model):
+    """A book's place on a leaderboard, maintained by Backend.books.leaderboards."""
+    class Board(models.TextChoices):
+        TOP_RATED = 'top-rated'
+        TRENDING = 'trending'
+    board = models.CharField(max_length=10, choices=Board.choices)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='rankings')
+    # Copied from the book so a per-author page is one index range.
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'book'], name='ranking_board_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['board', '-score', 'book'], name='ranking_board_score_idx'),
+            models.Index(fields=['board', 'author', '-score', 'book'], name='ranking_author_score_idx'),
+        ]
+
+
+class BookSimilarity(models.Model):
+    """One of a book's nearest neighbours, written by the build_recommendations command."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'similar'], name='similarity_book_similar_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book', '-score'], name='similarity_book_score_idx'),
+        ]
+
+
+class Job(models.Model):
+    """Deferred work, run by the run_workers command. See Backend.books.jobs."""
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+    task = models.CharField(max_length=100)
+    # The object the job works on; queued jobs of a task are coalesced per target.
+    target = models.CharField(max_length=100, blank=True, default='')
+    payload = models.JSONField(default=dict, blank=True)
+    # A job enqueued with a key already used is dropped, so retried requests enqueue once.
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'target'], condition=models.Q(status='queued'),
+                                    name='job_queued_task_target_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task}({self.target}) {self.status}'
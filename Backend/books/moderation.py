@@ -0,0 +1,39 @@
+"""
+Review moderation. New reviews are pending until staff approve them, in bulk,
+from the admin or the moderation endpoint; only approved reviews are shown
+and counted in the books' aggregates.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from Backend.books.aggregates import apply_rating_changes
+from Backend.books.cache import invalidate_reviews
+from Backend.books.jobs import enqueue_many
+from Backend.books.models import Review
+
+
+def get_max_moderation_size():
+    return getattr(settings, 'MODERATION_MAX_BATCH_SIZE', 10000)
+
+
+def moderate(reviews, decision):
+    """
+    Give every review of the ``reviews`` queryset the status ``decision`` in
+    one UPDATE, and move their ratings in or out of the books' aggregates in
+    the same transaction. Returns the number of reviews whose status changed.
+    """
+    reviews = reviews.exclude(status=decision)
+    approving = decision == Review.Status.APPROVED
+    # Approving adds every rating to the aggregates, anything else removes the approved ones.
+    counted = reviews if approving else reviews.filter(status=Review.Status.APPROVED)
+    with transaction.atomic():
+        counts = list(counted.order_by().values_list('book_id', 'rating').annotate(n=Count('id')))
+        withdrawn = [] if approving else list(counted.values_list('id', flat=True))
+        changed = reviews.update(status=decision, updated_at=timezone.now())
+        apply_rating_changes(counts, 1 if approving else -1)
+        book_ids = {book_id for book_id, _, _ in counts}
+        enqueue_many('refresh_rankings', book_ids)
+        invalidate_reviews(withdrawn, book_ids)
+    return changed
@@ -0,0 +1,166 @@
+import base64
+import datetime
+import json
+import math
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from Backend.books.filters import MIN_INTEGER, MAX_INTEGER
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on an indexed, unique ordering instead of
+    using OFFSET, so every page costs the same as the first one.
+
+    The last field of ``ordering`` must be unique (usually ``id``). Cursors are
+    opaque base64 tokens holding the ordering values of the boundary row and
+    the direction of travel.
+    """
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.build_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """Return the sliced queryset for the requested page (one row extra to detect more)."""
+        self.request = request
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.get_ordering()
+        if self.reverse:
+            ordering = tuple(f[1:] if f.startswith('-') else '-' + f for f in ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, self.position))
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def build_page(self, rows):
+        """Trim the extra row fetched by ``page_queryset`` and work out the neighbour cursors."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            has_next, has_previous = self.position is not None, has_more
+        else:
+            has_next, has_previous = has_more, self.position is not None
+
+        self.next_cursor = self.encode_cursor(rows[-1], reverse=False) if rows and has_next else None
+        self.previous_cursor = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_link(self.next_cursor)),
+            ('previous', self.get_link(self.previous_cursor)),
+            ('results', data),
+        ]))
+
+    def get_ordering(self):
+        return self.ordering
+
+    def get_ordering_fields(self):
+        """The names of the ordering fields, which paginated rows must carry."""
+        return [f.lstrip('-') for f in self.get_ordering()]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    @staticmethod
+    def seek_filter(ordering, position):
+        # (a, b) > (x, y) is written as a >= x AND (a > x OR (a = x AND b > y)) so the
+        # leading range can be answered from the index instead of scanning from the start.
+        names = [f.lstrip('-') for f in ordering]
+        ops = ['lt' if f.startswith('-') else 'gt' for f in ordering]
+        strictly_after = Q()
+        for i in range(len(names)):
+            clause = Q(**{f'{names[i]}__{ops[i]}': position[i]})
+            for j in range(i):
+                clause &= Q(**{names[j]: position[j]})
+            strictly_after |= clause
+        return Q(**{f'{names[0]}__{ops[0]}e': position[0]}) & strictly_after
+
+    def row_position(self, row):
+        names = self.get_ordering_fields()
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def encode_cursor(self, row, reverse):
+        values = [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v
+                  for v in self.row_position(row)]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['p']
+            if len(values) != len(self.get_ordering()):
+                raise ValueError
+            return check_position(self.to_position(values)), bool(payload.get('r'))
+        except (TypeError, ValueError, OverflowError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_position(self, values):
+        names = self.get_ordering_fields()
+        return [self.model._meta.get_field(name).to_python(value) for name, value in zip(names, values)]
+
+
+def check_position(position):
+    """Reject the values a database cannot compare with: infinite floats and integers beyond 64 bits."""
+    for value in position:
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError
+        if isinstance(value, int) and not MIN_INTEGER <= value <= MAX_INTEGER:
+            raise ValueError
+    return position
+
+
+class AuthorPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class BookPagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class ReviewPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class ModerationPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+
+class LeaderboardPagination(KeysetPagination):
+    ordering = ('-score', 'book_id')
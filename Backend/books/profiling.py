@@ -0,0 +1,215 @@
+import random
+import selectors
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import thread as futures_thread
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from Backend.books.metrics import current, route_name
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_KEY = 'books:profile:%s'
+INDEX_KEY = 'books:profiles'
+TOP_FUNCTIONS = 30
+MAX_QUERIES = 500
+# Where threads wait with nothing to do: an executor without work, an event loop without events.
+IDLE_CODES = {futures_thread._worker.__code__, selectors.DefaultSelector.select.__code__}
+
+
+def get_cache():
+    return caches[getattr(settings, 'PROFILE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PROFILE_TIMEOUT', 24 * 3600)
+
+
+def profile_trigger(request):
+    """'header' or 'sample' if the request is to be profiled, else None. Costs a dict lookup when off."""
+    if PROFILE_HEADER in request.META:
+        return 'header' if is_staff_request(request) else None
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def is_staff_request(request):
+    # The views authenticate later, with the API's authentication classes; do the same up front.
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return bool(drf_request.user and drf_request.user.is_staff)
+    except APIException:
+        return False
+
+
+class StackSampler:
+    """
+    Sample the call stacks of some threads from a background thread every
+    ``interval`` seconds. Each sample is weighted by the time since the
+    previous one, so the totals stay right when the GIL delays a sample.
+    Idle threads are not sampled.
+    """
+
+    def __init__(self, thread_ids, interval):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.frames, self.samples, self.weights = [], [], []
+        self._index = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None and frame.f_code not in IDLE_CODES:
+                    self.samples.append(self._stack(frame))
+                    self.weights.append(now - last)
+            last = now
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if key not in self._index:
+                self._index[key] = len(self.frames)
+                self.frames.append(key)
+            stack.append(self._index[key])
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+
+class RequestProfile:
+    """A stack sampler on the threads serving the request, plus the request's query log and timings."""
+
+    def __init__(self, trigger, thread_ids):
+        self.trigger = trigger
+        self.sampler = StackSampler(thread_ids, getattr(settings, 'PROFILE_INTERVAL', 0.001))
+        self.metrics = current.get()
+        if self.metrics is not None:
+            self.metrics.query_log = []
+        self.started = timezone.now()
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+
+    def save(self, request, response):
+        metrics, sampler = self.metrics, self.sampler
+        queries = metrics.query_log if metrics is not None else []
+        profile = {
+            'id': uuid.uuid4().hex,
+            'created_at': self.started.isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'route': route_name(request),
+            'status': response.status_code,
+            'trigger': self.trigger,
+            'duration_ms': round((timezone.now() - self.started).total_seconds() * 1000, 2),
+            'db_ms': round(metrics.db_time * 1000, 2) if metrics is not None else None,
+            'serialize_ms': round(metrics.serialize_time * 1000, 2) if metrics is not None else None,
+            'sample_count': len(sampler.samples),
+            'query_count': len(queries),
+            'queries': [{'ms': round(seconds * 1000, 3), 'sql': sql} for sql, seconds in queries[:MAX_QUERIES]],
+        }
+        store(profile, {'frames': sampler.frames, 'samples': sampler.samples, 'weights': sampler.weights})
+        response['X-Profile-Id'] = profile['id']
+        return profile
+
+
+def summary(profile):
+    return {key: value for key, value in profile.items() if key != 'queries'}
+
+
+def store(profile, samples):
+    cache = get_cache()
+    cache.set(PROFILE_KEY % profile['id'], dict(profile, samples=samples), get_timeout())
+    # Read-modify-write: with several workers an entry may occasionally drop out of the index.
+    index = [summary(profile)] + (cache.get(INDEX_KEY) or [])
+    cache.set(INDEX_KEY, index[:getattr(settings, 'PROFILE_KEEP', 50)], get_timeout())
+
+
+def recent():
+    return get_cache().get(INDEX_KEY) or []
+
+
+def load(profile_id):
+    """The stored profile with its stack samples, or None."""
+    return get_cache().get(PROFILE_KEY % profile_id)
+
+
+def function_name(func):
+    filename, line, name = func
+    return f'{filename}:{line}({name})' if line else name
+
+
+def pstats_data(samples):
+    """
+    The samples as the stats dict pstats.Stats reads (what Profile.dump_stats
+    writes). Call counts are sample counts; times are sampled seconds.
+    """
+    frames = [tuple(frame) for frame in samples['frames']]
+    stats = {}
+    for stack, weight in zip(samples['samples'], samples['weights']):
+        seen = set()
+        for depth, index in enumerate(stack):
+            entry = stats.setdefault(index, [0, 0, 0.0, 0.0, {}])
+            leaf = depth == len(stack) - 1
+            if leaf:
+                entry[2] += weight
+            if index not in seen:  # a recursive function counts once per sample
+                seen.add(index)
+                entry[0] += 1
+                entry[1] += 1
+                entry[3] += weight
+            if depth:
+                edge = entry[4].setdefault(frames[stack[depth - 1]], [0, 0, 0.0, 0.0])
+                edge[0] += 1
+                edge[1] += 1
+                edge[2] += weight if leaf else 0.0
+                edge[3] += weight
+    return {frames[index]: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+            for index, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    rows = sorted(stats.items(), key=lambda item: (item[1][2], item[1][3]), reverse=True)[:limit]
+    return [{'function': function_name(func), 'samples': nc, 'self_ms': round(tt * 1000, 3),
+             'total_ms': round(ct * 1000, 3)} for func, (cc, nc, tt, ct, callers) in rows]
+
+
+def speedscope(samples, name):
+    """The samples as a speedscope "sampled" profile (https://www.speedscope.app)."""
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'Backend.books.profiling',
+        'shared': {'frames': [{'name': func_name, 'file': filename, 'line': line}
+                              for filename, line, func_name in samples['frames']]},
+        'profiles': [{'type': 'sampled', 'name': name, 'unit': 'seconds', 'startValue': 0,
+                      'endValue': sum(samples['weights']), 'samples': samples['samples'],
+                      'weights': samples['weights']}],
+    }
@@ -0,0 +1,109 @@
+"""
+Item-item recommendations: "readers who liked this also liked". Built offline
+by the build_recommendations command, served by SimilarBooksView.
+"""
+from itertools import islice
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Q
+from scipy import sparse
+
+from Backend.books.cache import bump
+from Backend.books.models import BookSimilarity, Review
+
+
+def load_ratings(chunk_size=100000):
+    """
+    The rating matrix, users x books, centred on each user's mean rating so
+    that a book scores on how much more a reader liked it than their other
+    books. Returns (matrix as CSC, the book id of each column).
+    """
+    # Reviews written while loading are left for the next build.
+    last_id = Review.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    reviews = Review.objects.filter(id__lte=last_id, status=Review.Status.APPROVED)
+    count = reviews.count()
+    users, books = np.empty(count, dtype=np.int64), np.empty(count, dtype=np.int64)
+    ratings = np.empty(count, dtype=np.float32)
+    filled = 0
+    rows = reviews.values_list('user_id', 'book_id', 'rating').iterator(chunk_size=chunk_size)
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        block = np.array(chunk[:count - filled], dtype=np.int64).reshape(-1, 3)
+        size = len(block)
+        users[filled:filled + size], books[filled:filled + size] = block[:, 0], block[:, 1]
+        ratings[filled:filled + size] = block[:, 2]
+        filled += size
+    users, books, ratings = users[:filled], books[:filled], ratings[:filled]
+
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    book_ids, book_index = np.unique(books, return_inverse=True)
+    means = np.bincount(user_index, weights=ratings, minlength=len(user_ids)) / \
+        np.maximum(np.bincount(user_index, minlength=len(user_ids)), 1)
+    centred = ratings - means[user_index].astype(np.float32)
+    matrix = sparse.csc_matrix((centred, (user_index, book_index)), shape=(len(user_ids), len(book_ids)))
+    return matrix, book_ids
+
+
+def nearest_neighbours(matrix, eligible, neighbours, block_size):
+    """
+    For each block of ``block_size`` columns, yield the block's range and the
+    (column, neighbour columns, scores) of its columns: the eligible columns
+    with the highest positive cosine similarity, best first. Only one block of
+    the similarity matrix is held at a time.
+    """
+    norms = np.sqrt(np.asarray(matrix.power(2).sum(axis=0)).ravel())
+    norms[norms == 0] = np.inf
+    transposed = matrix.T.tocsr()
+    count = matrix.shape[1]
+    k = min(neighbours, count - 1)
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        if k <= 0:
+            yield start, stop, []
+            continue
+        scores = (transposed[start:stop] @ matrix).toarray()
+        scores /= norms[start:stop, None]
+        scores /= norms[None, :]
+        scores[:, ~eligible] = -np.inf
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        keep = top_scores > 0
+        yield start, stop, [(start + row, top[row][keep[row]], top_scores[row][keep[row]])
+                            for row in range(stop - start) if keep[row].any()]
+
+
+def build_similarities(neighbours=20, min_reviews=2, memory=256 * 2 ** 20, chunk_size=100000):
+    """
+    Replace the stored neighbour lists of every book with its ``neighbours``
+    most similar books among those with at least ``min_reviews`` reviews.
+    ``memory`` bounds the bytes of each block of the similarity matrix. Each
+    block is written in its own transaction, so writers are never held up for
+    the whole build. Returns (books with neighbours, neighbour rows written).
+    """
+    matrix, book_ids = load_ratings(chunk_size)
+    eligible = np.diff(matrix.indptr) >= min_reviews
+    # A block holds its scores and about three temporaries of the same size.
+    block_size = max(1, memory // (16 * max(1, len(book_ids))))
+
+    table = connection.ops.quote_name(BookSimilarity._meta.db_table)
+    sql = f'INSERT INTO {table} (book_id, similar_id, score) VALUES (%s, %s, %s)'
+    books = written = 0
+    for start, stop, block in nearest_neighbours(matrix, eligible, neighbours, block_size):
+        rows = [(int(book_ids[column]), int(similar_id), round(float(score), 6))
+                for column, similar, scores in block for similar_id, score in zip(book_ids[similar], scores)]
+        with transaction.atomic(), connection.cursor() as cursor:
+            # The ids are sorted: the range also clears books without reviews in between.
+            BookSimilarity.objects.filter(book_id__gte=book_ids[start], book_id__lte=book_ids[stop - 1]).delete()
+            cursor.executemany(sql, rows)
+        books += len(block)
+        written += len(rows)
+    # Books outside the range of reviewed ones.
+    stale = BookSimilarity.objects.all()
+    if len(book_ids):
+        stale = stale.filter(Q(book_id__lt=book_ids[0]) | Q(book_id__gt=book_ids[-1]))
+    stale.delete()
+    bump('similar')
+    return books, written
@@ -0,0 +1,78 @@
+import io
+import json
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from Backend.books.metrics import timed_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes U+2028 and U+2029 raw; DRF's JSONRenderer escapes them so the
+# output is also valid JavaScript.
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def dumps(data):
+    """
+    Compact UTF-8 JSON, as ``json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+    separators=(',', ':'))`` would write it. Uses orjson when it is installed:
+    datetimes, dates and UUIDs are encoded natively, everything else orjson does
+    not know (Decimal, lazy strings, querysets...) goes through DRF's encoder.
+    Values orjson rejects, such as integers wider than 64 bits, fall back to json.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_UTC_Z)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using orjson for compact output. Indented output (the
+    browsable API, ``; indent=`` media type parameters) and non-default
+    JSON settings keep using the stdlib renderer.
+
+    The output is the same except for floats written in exponent notation
+    (orjson writes ``1e16`` where json writes ``1e+16``), which none of the
+    API's fields produce.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {})
+                or not self.compact or self.ensure_ascii or not self.strict):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_UTC_Z)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        for raw, escaped in LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser using orjson for UTF-8 bodies, with the stdlib parser's errors and limits."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let json report the error (or parse what orjson refuses, such as huge integers).
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,158 @@
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from Backend.books.models import Author, Book, Review
+from Backend.books.pagination import KeysetPagination
+
+# Documents live in the books_search FTS5 table under rowid = object id * 4 + kind,
+# see migration 0006_search_index.
+KINDS = {'author': 1, 'book': 2, 'review': 3}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+ROWID_STRIDE = 4
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# (kind, table, title column, body column, (column, value) a row must have to be indexed)
+# of every indexed document source.
+SOURCES = [
+    ('author', 'books_author', 'name', 'bio', None),
+    ('book', 'books_book', 'title', None, None),
+    ('review', 'books_review', None, 'review_text', ('status', 'approved')),
+]
+
+
+def trigger_statements():
+    for name, table, title, body, condition in SOURCES:
+        kind = KINDS[name]
+        columns = ', '.join(column for column in (title, body, condition and condition[0]) if column)
+        values = ', '.join(f'new.{column}' if column else "''" for column in (title, body))
+        insert = f'INSERT INTO books_search(rowid, title, body) SELECT {ROWID_STRIDE} * new.id + {kind}, {values}'
+        if condition:
+            insert += f" WHERE new.{condition[0]} = '{condition[1]}'"
+        delete = f'DELETE FROM books_search WHERE rowid = {ROWID_STRIDE} * old.id + {kind}'
+        yield (f'CREATE TRIGGER IF NOT EXISTS books_search_{name}_ai AFTER INSERT ON {table} '
+               f'BEGIN {insert}; END')
+        yield (f'CREATE TRIGGER IF NOT EXISTS books_search_{name}_au AFTER UPDATE OF {columns} ON {table} '
+               f'BEGIN {delete}; {insert}; END')
+        yield (f'CREATE TRIGGER IF NOT EXISTS books_search_{name}_ad AFTER DELETE ON {table} '
+               f'BEGIN {delete}; END')
+
+
+def install_search_triggers(using='default', **kwargs):
+    """post_migrate receiver: SQLite drops triggers whenever a migration rebuilds a table."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite' or 'books_search' not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        for statement in trigger_statements():
+            cursor.execute(statement)
+
+
+def drop_search_triggers(using='default'):
+    """For bulk loads, which call rebuild_search_index() and install_search_triggers() afterwards."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for name, _, _, _, _ in SOURCES:
+            for suffix in ('ai', 'au', 'ad'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS books_search_{name}_{suffix}')
+
+
+def build_match_expression(query):
+    """Turn free text into an FTS5 expression: every word must match, the last one as a prefix."""
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_filter(query, kind):
+    """A filter on the objects of ``kind`` whose search document matches the free text ``query``."""
+    expression = build_match_expression(query)
+    if expression is None:
+        return Q()
+    sql = (f'SELECT rowid / {ROWID_STRIDE} FROM books_search '
+           f'WHERE books_search MATCH %s AND rowid %% {ROWID_STRIDE} = %s')
+    return Q(id__in=RawSQL(sql, [expression, KINDS[kind]]))
+
+
+class SearchPagination(KeysetPagination):
+    ordering = ('rank', 'rowid')
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_search(self, expression, request, kind=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        sql = ['SELECT rowid, rank, snippet(books_search, -1, \'[\', \']\', \'…\', 12)',
+               'FROM books_search WHERE books_search MATCH %s']
+        params = [expression]
+        if kind is not None:
+            sql.append('AND rowid %% %s = %s')
+            params += [ROWID_STRIDE, KINDS[kind]]
+        if self.position is not None:
+            op = '<' if self.reverse else '>'
+            sql.append(f'AND (rank {op} %s OR (rank = %s AND rowid {op} %s))')
+            params += [self.position[0], self.position[0], self.position[1]]
+        direction = 'DESC' if self.reverse else 'ASC'
+        sql.append(f'ORDER BY rank {direction}, rowid {direction} LIMIT %s')
+        params.append(self.page_size + 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            rows = [{'rowid': rowid, 'rank': rank, 'snippet': snippet}
+                    for rowid, rank, snippet in cursor.fetchall()]
+        return self.build_page(rows)
+
+    def to_position(self, values):
+        return [float(values[0]), int(values[1])]
+
+
+def hydrate(rows):
+    """Attach the display fields of each hit, one query per kind of document found."""
+    ids = {code: [] for code in KIND_NAMES}
+    for row in rows:
+        ids[row['rowid'] % ROWID_STRIDE].append(row['rowid'] // ROWID_STRIDE)
+
+    objects = {
+        KINDS['author']: {a['id']: {'name': a['name']}
+                          for a in Author.objects.filter(id__in=ids[KINDS['author']]).values('id', 'name')},
+        KINDS['book']: {b['id']: {'title': b['title'], 'author': b['author_id'], 'author_name': b['author__name']}
+                        for b in Book.objects.filter(id__in=ids[KINDS['book']])
+                        .values('id', 'title', 'author_id', 'author__name')},
+        KINDS['review']: {r['id']: {'book': r['book_id'], 'book_title': r['book__title'], 'rating': r['rating']}
+                          for r in Review.objects.filter(id__in=ids[KINDS['review']], status=Review.Status.APPROVED)
+                          .values('id', 'book_id', 'book__title', 'rating')},
+    }
+
+    results = []
+    for row in rows:
+        code, object_id = row['rowid'] % ROWID_STRIDE, row['rowid'] // ROWID_STRIDE
+        fields = objects[code].get(object_id)
+        if fields is None:
+            continue
+        results.append({'type': KIND_NAMES[code], 'id': object_id, 'score': -row['rank'],
+                        'snippet': row['snippet'], **fields})
+    return results
+
+
+def rebuild_search_index():
+    """Drop and re-create every search document from the catalog tables in three INSERT ... SELECTs."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM books_search")
+        for name, table, title, body, condition in SOURCES:
+            columns = ', '.join(column or "''" for column in (title, body))
+            where = f" WHERE {condition[0]} = '{condition[1]}'" if condition else ''
+            cursor.execute(f"INSERT INTO books_search(rowid, title, body) "
+                           f"SELECT {ROWID_STRIDE} * id + {KINDS[name]}, {columns} FROM {table}{where}")
+        cursor.execute("INSERT INTO books_search(books_search) VALUES ('optimize')")
+        cursor.execute("SELECT count(*) FROM books_search")
+        return cursor.fetchone()[0]
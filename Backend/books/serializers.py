@@ -48,10 +48,67 @@ class BookSerializer(serializers.ModelSerializer):
     def get_author_name(self, obj):
         return obj.author.name
 
+
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
+        # Set by moderators only, see Backend.books.moderation.
+        read_only_fields = ('status',)
 
     def get_book_title(self, obj):
-        return obj.book.title
\ No newline at end of file
+        return obj.book.title
+
+
+# Read-side serializers. They expect the related rows to be loaded up front
+# (select_related / prefetch_related) so a list costs a fixed number of queries.
+
+class BookListSerializer(BookSerializer):
+    author_name = serializers.SerializerMethodField()
+    rating_average = serializers.FloatField(read_only=True)
+
+    class Meta(BookSerializer.Meta):
+        fields = ('id', 'title', 'publication_date', 'isbn', 'author', 'author_name',
+                  'review_count', 'rating_average', 'rating_histogram')
+
+
+class BookDetailSerializer(BookListSerializer):
+    reviews = ReviewSerializer(many=True, read_only=True)
+
+    class Meta(BookListSerializer.Meta):
+        fields = BookListSerializer.Meta.fields + ('reviews',)
+
+
+class ReviewDetailSerializer(ReviewSerializer):
+    book_title = serializers.SerializerMethodField()
+
+    class Meta(ReviewSerializer.Meta):
+        fields = ('id', 'rating', 'review_text', 'created_at', 'book', 'user', 'book_title')
+
+
+class ReviewListSerializer(ReviewDetailSerializer):
+    creator = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta(ReviewDetailSerializer.Meta):
+        fields = ReviewDetailSerializer.Meta.fields + ('creator',)
+
+
+# Batch-write serializers. Related ids and uniqueness are checked for the whole batch at
+# once by Backend.books.batch instead of with one query per item.
+
+class BookBatchSerializer(BookSerializer):
+    author = serializers.IntegerField(min_value=1)
+
+    class Meta(BookSerializer.Meta):
+        extra_kwargs = {'isbn': {'validators': []}}
+
+
+class ReviewBatchSerializer(ReviewSerializer):
+    id = serializers.IntegerField(min_value=1, required=False)
+    book = serializers.IntegerField(min_value=1)
+    user = serializers.IntegerField(min_value=1)
+
+
+class ModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    status = serializers.ChoiceField([Review.Status.APPROVED, Review.Status.REJECTED])
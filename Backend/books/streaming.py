@@ -0,0 +1,87 @@
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from Backend.books.compiled import CompiledSerializer
+from Backend.books.renderers import dumps
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renders a list as one JSON document per line. Streaming list views bypass it."""
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(dumps(item) + b'\n' for item in items)
+
+
+def wants_stream(request):
+    return (request.query_params.get('stream') in ('1', 'true')
+            or getattr(request.accepted_renderer, 'format', None) == NDJSONRenderer.format)
+
+
+def serialize_chunks(queryset, serializer_class, chunk_size):
+    """
+    Yield the serialized rows of ``queryset`` one chunk at a time.
+    ``serializer_class`` may also be a ``CompiledSerializer``.
+    """
+    if isinstance(serializer_class, CompiledSerializer):
+        rows, serialize = serializer_class.values(queryset), serializer_class.serialize
+    else:
+        rows, serialize = queryset, lambda chunk: serializer_class(chunk, many=True).data
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield serialize(chunk)
+            chunk = []
+    if chunk:
+        yield serialize(chunk)
+
+
+def stream_json_array(chunks):
+    yield b'['
+    first = True
+    for chunk in chunks:
+        body = b','.join(dumps(item) for item in chunk)
+        if body:
+            yield body if first else b',' + body
+            first = False
+    yield b']'
+
+
+def stream_ndjson(chunks):
+    for chunk in chunks:
+        yield b''.join(dumps(item) + b'\n' for item in chunk)
+
+
+def export_body(request, queryset, serializer_class, chunk_size):
+    chunks = serialize_chunks(queryset, serializer_class, chunk_size)
+    if request.accepted_renderer.format == NDJSONRenderer.format:
+        return stream_ndjson(chunks), NDJSON_MEDIA_TYPE
+    return stream_json_array(chunks), 'application/json'
+
+
+def stream_response(request, queryset, serializer_class, chunk_size=1000):
+    """
+    Stream every row of ``queryset`` as a JSON array, or as NDJSON when that
+    was negotiated, reading and serializing ``chunk_size`` rows at a time so
+    memory stays flat whatever the size of the result.
+    """
+    body, content_type = export_body(request, queryset, serializer_class, chunk_size)
+    return StreamingHttpResponse(body, content_type=content_type)
+
+
+def buffered_response(request, queryset, serializer_class, chunk_size=1000):
+    """
+    The same export as ``stream_response``, built in full. Async views use it
+    from a worker thread: Django 4.1's ASGI handler iterates streaming bodies
+    on the event loop, where the queries behind each chunk are not allowed.
+    """
+    body, content_type = export_body(request, queryset, serializer_class, chunk_size)
+    return HttpResponse(b''.join(body), content_type=content_type)
@@ -1,3 +1,1352 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import io
+import json
+import pstats
+import tempfile
+import time
+import zoneinfo
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Backend.books.auth import principals
+from Backend.books.cache import get_versions
+from Backend.books.compiled import CompiledSerializer, author_list, book_list, review_list
+from Backend.books.compression import negotiate
+from Backend.books.db import ReadReplicaRouter
+from Backend.books.jobs import enqueue, enqueue_many, run_pending, task
+from Backend.books.metrics import registry
+from Backend.books.models import FullUser, Author, Book, BookSimilarity, Job, Review
+from Backend.books.pagination import BookPagination
+from Backend.books.recommendations import build_similarities
+from Backend.books.renderers import ORJSONParser, ORJSONRenderer
+from Backend.books.serializers import AuthorSerializer, BookListSerializer, BookDetailSerializer, ReviewListSerializer
+from Backend.books.streaming import stream_response
+
+
+APPROVED = Review.Status.APPROVED
+
+
+def make_catalog(authors=2, books_per_author=3, reviews_per_book=4):
+    users = [FullUser.objects.create(username=f'reader{i}', gender='Other') for i in range(3)]
+    for a in range(authors):
+        author = Author.objects.create(name=f'Author {a}', bio='bio')
+        for b in range(books_per_author):
+            book = Book.objects.create(title=f'Book {a}-{b}', author=author,
+                                       publication_date=datetime.date(2000 + b, 1, 1),
+                                       isbn=f'978{a:05d}{b:05d}')
+            for r in range(reviews_per_book):
+                Review.objects.create(book=book, user=users[r % len(users)], rating=r % 10 + 1,
+                                      review_text=f'Review {r}', status=APPROVED)
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = FullUser.objects.create(username='staff', gender='Other', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryBudgetTests(APITestCase):
+    # Maximum number of queries each read endpoint may issue, independent of row count.
+    budgets = {
+        'author-list': ('/authors/', 1),
+        'author-detail': ('/authors/{author}/', 1),
+        'book-list': ('/books/', 1),
+        'book-single': ('/books/{book}/', 2),
+        'author-book-list': ('/author/{author}/books/', 2),
+        'book-detail': ('/author/{author}/books/{book}/', 2),
+        'review-list': ('/reviews/', 1),
+        'book-review-list': ('/author/{author}/book/{book}/reviews', 2),
+        'review-detail': ('/author/{author}/book/{book}/reviews/{review}/', 1),
+        'leaderboard': ('/leaderboards/top-rated/', 2),
+        'book-similar': ('/books/{book}/similar/', 2),
+    }
+
+    def urls(self):
+        review = Review.objects.order_by('id').first()
+        ids = {'author': review.book.author_id, 'book': review.book_id, 'review': review.id}
+        return {name: (url.format(**ids), budget) for name, (url, budget) in self.budgets.items()}
+
+    def assertWithinBudgets(self):
+        for name, (url, budget) in self.urls().items():
+            with self.subTest(endpoint=name):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(ctx.captured_queries), budget,
+                                     '\n'.join(q['sql'] for q in ctx.captured_queries))
+
+    def test_small_catalog(self):
+        make_catalog(authors=1, books_per_author=1, reviews_per_book=1)
+        self.assertWithinBudgets()
+
+    def test_large_catalog(self):
+        make_catalog(authors=4, books_per_author=5, reviews_per_book=6)
+        self.assertWithinBudgets()
+
+    def test_list_payload(self):
+        make_catalog(authors=1, books_per_author=1, reviews_per_book=1)
+        book = self.client.get('/books/').json()['results'][0]
+        self.assertEqual(book['author_name'], 'Author 0')
+        review = self.client.get('/reviews/').json()['results'][0]
+        self.assertEqual((review['book_title'], review['creator']), ('Book 0-0', 'reader0'))
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=5, reviews_per_book=3)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                page = self.client.get(url).json()
+            self.assertEqual(len(ctx.captured_queries), 1)
+            ids += [row['id'] for row in page['results']]
+            url, pages = page['next'], pages + 1
+        return ids, pages
+
+    def test_walks_every_book_once(self):
+        ids, pages = self.walk('/books/?page_size=3')
+        self.assertEqual(ids, list(Book.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(pages, 4)
+
+    def test_reviews_newest_first(self):
+        Review.objects.update(created_at=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc))
+        ids, _ = self.walk('/reviews/?page_size=4')
+        self.assertEqual(ids, list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_previous_cursor(self):
+        first = self.client.get('/books/?page_size=4').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNotNone(back['next'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(BookPagination, 'max_page_size', 2):
+            self.assertEqual(len(self.client.get('/books/?page_size=100').json()['results']), 2)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/books/?cursor=not-a-cursor').status_code, 404)
+        created_at = timezone.now().isoformat()
+        for url, position in (('/books/', [10 ** 30]), ('/books/', [-2 ** 63 - 1]),
+                              ('/reviews/', [created_at, 10 ** 30]), ('/search/?q=book', ['Infinity', 1]),
+                              ('/search/?q=book', [1e308 * 10, 1]), ('/search/?q=book', [1.5, 10 ** 30])):
+            raw = json.dumps({'p': position, 'r': 0}).encode()
+            cursor = base64.urlsafe_b64encode(raw).decode().rstrip('=')
+            with self.subTest(url=url, position=position):
+                separator = '&' if '?' in url else '?'
+                self.assertEqual(self.client.get(f'{url}{separator}cursor={cursor}').status_code, 404)
+
+
+
+class ListFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=4, reviews_per_book=5)
+        self.author = Author.objects.order_by('id').first()
+        self.book = Book.objects.order_by('id').first()
+        self.reader = FullUser.objects.get(username='reader1')
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def walk(self, url):
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids += [row['id'] for row in page['results']]
+            url = page['next']
+        return ids
+
+    def test_filters(self):
+        books = Book.objects.order_by('id')
+        self.assertEqual(self.ids(f'/books/?author={self.author.id}'),
+                         [book.id for book in books.filter(author=self.author)])
+        self.assertEqual(self.ids('/books/?published_after=2001-01-01&published_before=2002-12-31'),
+                         [book.id for book in books.filter(publication_date__year__in=(2001, 2002))])
+        reviews = Review.objects.order_by('-created_at', '-id')
+        self.assertEqual(self.ids(f'/reviews/?user={self.reader.id}'),
+                         [review.id for review in reviews.filter(user=self.reader)])
+        self.assertEqual(self.ids(f'/reviews/?book={self.book.id}&min_rating=4'),
+                         [review.id for review in reviews.filter(book=self.book, rating__gte=4)])
+
+    def test_orderings_page_through(self):
+        Review.objects.update(created_at=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(self.walk('/books/?ordering=-title&page_size=3'),
+                         list(Book.objects.order_by('-title', '-id').values_list('id', flat=True)))
+        self.assertEqual(self.walk('/books/?ordering=publication_date&page_size=3'),
+                         list(Book.objects.order_by('publication_date', 'id').values_list('id', flat=True)))
+        url = f'/author/{self.author.id}/book/{self.book.id}/reviews?ordering=-rating&page_size=2'
+        self.assertEqual(self.walk(url),
+                         list(self.book.reviews.order_by('-rating', '-id').values_list('id', flat=True)))
+        exported = json.loads(self.client.get('/reviews/?ordering=created_at&stream=1').getvalue())
+        self.assertEqual(exported[0]['id'], Review.objects.order_by('created_at', 'id').first().id)
+
+    def test_invalid_parameters(self):
+        for url in ('/books/?author=x', '/books/?published_after=2001-13-01', '/books/?ordering=isbn',
+                    '/reviews/?min_rating=11', '/reviews/?ordering=rating', '/reviews/?user=1.5',
+                    f'/books/?author={2 ** 63}', f'/reviews/?book={10 ** 23}', f'/reviews/?user=-{10 ** 23}',
+                    f'/leaderboards/top-rated/?author={10 ** 23}'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_every_filter_and_ordering_uses_an_index(self):
+        urls = [
+            f'/books/?author={self.author.id}',
+            f'/books/?author={self.author.id}&ordering=-publication_date',
+            '/books/?published_after=2001-01-01&published_before=2002-12-31&ordering=publication_date',
+            '/books/?ordering=title',
+            '/books/?ordering=-title',
+            f'/author/{self.author.id}/book/{self.book.id}/reviews',
+            f'/author/{self.author.id}/book/{self.book.id}/reviews?ordering=rating',
+            f'/reviews/?user={self.reader.id}',
+            f'/reviews/?book={self.book.id}&min_rating=5&ordering=-rating',
+            '/reviews/?min_rating=5',
+            '/reviews/?ordering=created_at',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + ctx.captured_queries[-1]['sql'])
+                    plan = [row[-1] for row in cursor.fetchall()]
+                self.assertFalse([step for step in plan if step.startswith('SCAN') and 'INDEX' not in step], plan)
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=1, books_per_author=2, reviews_per_book=0)
+        self.book, self.other = Book.objects.order_by('id')
+
+    def assertAggregates(self, book, count, total, histogram):
+        book.refresh_from_db()
+        self.assertEqual((book.review_count, book.rating_sum, book.rating_histogram), (count, total, histogram))
+
+    def test_incremental_updates(self):
+        review = Review.objects.create(book=self.book, user=self.user, rating=8, review_text='x', status=APPROVED)
+        Review.objects.create(book=self.book, user=self.user, rating=2, review_text='y', status=APPROVED)
+        self.assertAggregates(self.book, 2, 10, [0, 1, 0, 0, 0, 0, 0, 1, 0, 0])
+
+        review.rating = 9
+        review.save()
+        self.assertAggregates(self.book, 2, 11, [0, 1, 0, 0, 0, 0, 0, 0, 1, 0])
+
+        review.book = self.other
+        review.save()
+        self.assertAggregates(self.book, 1, 2, [0, 1, 0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertAggregates(self.other, 1, 9, [0, 0, 0, 0, 0, 0, 0, 0, 1, 0])
+
+        review.delete()
+        self.assertAggregates(self.other, 0, 0, [0] * 10)
+
+    def test_rebuild_matches_incremental(self):
+        for rating in (3, 3, 10):
+            Review.objects.create(book=self.book, user=self.user, rating=rating, review_text='x', status=APPROVED)
+        Book.objects.update(review_count=0, rating_sum=0, rating_histogram=[5] * 10)
+        call_command('rebuild_rating_aggregates', stdout=io.StringIO())
+        self.assertAggregates(self.book, 3, 16, [0, 0, 2, 0, 0, 0, 0, 0, 0, 1])
+        self.assertAggregates(self.other, 0, 0, [0] * 10)
+
+    def test_served_on_book_list(self):
+        Review.objects.create(book=self.book, user=self.user, rating=7, review_text='x', status=APPROVED)
+        Review.objects.create(book=self.book, user=self.user, rating=8, review_text='x', status=APPROVED)
+        book = self.client.get('/books/').json()['results'][0]
+        self.assertEqual((book['review_count'], book['rating_average']), (2, 7.5))
+
+
+
+class LeaderboardTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = Author.objects.create(name='Author', bio='bio')
+        self.other = Author.objects.create(name='Other', bio='bio')
+        self.readers = [FullUser.objects.create(username=f'reader{i}', gender='Other') for i in range(20)]
+        self.one_hit = self.book('One hit', self.other)
+        self.steady = self.book('Steady', self.author)
+        self.middling = self.book('Middling', self.author)
+        self.review(self.one_hit, 10)
+        for reader in self.readers:
+            self.review(self.steady, 9, reader)
+            self.review(self.middling, 6, reader)
+        call_command('refresh_leaderboards', stdout=io.StringIO())
+
+    def book(self, title, author):
+        return Book.objects.create(title=title, author=author, publication_date=datetime.date(2000, 1, 1),
+                                   isbn=f'978{Book.objects.count():010d}')
+
+    def review(self, book, rating, reader=None):
+        return Review.objects.create(book=book, user=reader or self.readers[0], rating=rating, review_text='text',
+                                     status=APPROVED)
+
+    def board(self, url):
+        page = self.client.get(url).json()
+        return [(row['title'], row['score']) for row in page['results']]
+
+    def test_top_rated_is_smoothed(self):
+        # One 10 is pulled towards the catalog mean; twenty 9s barely move.
+        self.assertEqual([title for title, _ in self.board('/leaderboards/top-rated/')],
+                         ['Steady', 'One hit', 'Middling'])
+        self.assertEqual(self.board(f'/leaderboards/top-rated/?author={self.author.id}'),
+                         [('Steady', round((10 * 310 / 41 + 180) / 30, 3)), ('Middling', 6.52)])
+
+    def test_trending_decays(self):
+        now = timezone.now()
+        self.steady.reviews.update(created_at=now - datetime.timedelta(days=14))
+        self.middling.reviews.update(created_at=now - datetime.timedelta(days=60))
+        call_command('refresh_leaderboards', stdout=io.StringIO())
+        self.assertEqual(self.board('/leaderboards/trending/'), [('Steady', 5.0), ('One hit', 1.0)])
+        self.review(self.middling, 5)
+        run_pending()
+        self.assertEqual(self.board('/leaderboards/trending/')[1:], [('Middling', 1.0), ('One hit', 1.0)])
+
+    def test_refreshed_on_review_writes(self):
+        reviews = [self.review(self.one_hit, 10, reader) for reader in self.readers[1:10]]
+        self.assertEqual(self.board('/leaderboards/top-rated/')[0][0], 'Steady')
+        run_pending()
+        self.assertEqual(self.board('/leaderboards/top-rated/')[0][0], 'One hit')
+        Review.objects.filter(id__in=[review.id for review in reviews[:4]]).delete()
+        run_pending()
+        self.assertEqual(self.board('/leaderboards/top-rated/')[0][0], 'Steady')
+        self.steady.author = self.other
+        self.steady.save()
+        self.assertEqual(self.board(f'/leaderboards/top-rated/?author={self.other.id}')[0][0], 'Steady')
+
+    def test_upsert_moves_rankings(self):
+        item = {'title': 'Steady', 'author': self.other.id, 'publication_date': '2000-01-01', 'isbn': self.steady.isbn}
+        self.assertEqual(self.client.post('/books/?upsert=isbn', [item], format='json').status_code, 201)
+        self.assertEqual(self.board(f'/leaderboards/top-rated/?author={self.other.id}')[0][0], 'Steady')
+        titles = [title for title, _ in self.board(f'/leaderboards/top-rated/?author={self.author.id}')]
+        self.assertNotIn('Steady', titles)
+
+    def test_pages_and_errors(self):
+        first = self.client.get('/leaderboards/top-rated/?page_size=2').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['title'] for row in first['results'] + second['results']],
+                         ['Steady', 'One hit', 'Middling'])
+        self.assertEqual(self.client.get('/leaderboards/newest/').status_code, 404)
+        self.assertEqual(self.client.get('/leaderboards/trending/?author=x').status_code, 400)
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        author = Author.objects.create(name='Author', bio='bio')
+        self.books = {title: Book.objects.create(title=title, author=author, publication_date=datetime.date(2000, 1, 1),
+                                                 isbn=f'978{i:010d}')
+                      for i, title in enumerate(['Dune', 'Hyperion', 'Emma', 'Persuasion', 'Solo'])}
+        # Science fiction readers and Austen readers, each liking their own and not the other.
+        ratings = {'Dune': (10, 9, 9, 2, 3, 2), 'Hyperion': (9, 10, 8, 3, 2, None),
+                   'Emma': (2, 3, 2, 9, 10, 9), 'Persuasion': (3, None, 2, 10, 9, 10), 'Solo': (None,) * 5 + (8,)}
+        readers = [FullUser.objects.create(username=f'reader{i}', gender='Other') for i in range(6)]
+        Review.objects.bulk_create(Review(book=self.books[title], user=reader, rating=rating, review_text='text',
+                                          status=APPROVED)
+                                   for title, row in ratings.items() for reader, rating in zip(readers, row)
+                                   if rating is not None)
+
+    def similar(self, title):
+        response = self.client.get(f'/books/{self.books[title].id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [(book['title'], book['similarity']) for book in response.json()['results']]
+
+    def test_readers_who_liked_this(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual([title for title, _ in self.similar('Dune')], ['Hyperion'])
+        self.assertEqual([title for title, _ in self.similar('Emma')], ['Persuasion'])
+        self.assertGreater(self.similar('Dune')[0][1], 0.5)
+        # Solo has readers in common with Persuasion, but a single review is not enough to be recommended.
+        self.assertEqual([title for title, _ in self.similar('Solo')], ['Persuasion', 'Emma'])
+        self.assertEqual([title for title, _ in self.similar('Persuasion')], ['Emma'])
+        self.assertEqual(self.client.get('/books/999/similar/').status_code, 404)
+
+    def test_blocks_give_the_same_neighbours(self):
+        build_similarities(neighbours=2, min_reviews=1)
+        whole = sorted(BookSimilarity.objects.values_list('book_id', 'similar_id', 'score'))
+        build_similarities(neighbours=2, min_reviews=1, memory=1)
+        self.assertEqual(sorted(BookSimilarity.objects.values_list('book_id', 'similar_id', 'score')), whole)
+        self.assertEqual(len(whole), 8)
+
+    def test_served_in_one_query(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        with self.assertNumQueries(1):
+            self.similar('Persuasion')
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        author = Author.objects.create(name='Žemaitė', bio='Lithuanian writer of village life')
+        self.book = Book.objects.create(title='Marti', author=author,
+                                        publication_date=datetime.date(1898, 1, 1), isbn='9780000000001')
+        Review.objects.create(book=self.book, user=self.user, rating=9, review_text='A sharp village drama',
+                              status=APPROVED)
+
+    def search(self, query):
+        return self.client.get('/search/', {'q': query}).json()['results']
+
+    def test_finds_each_kind(self):
+        self.assertEqual([(r['type'], r['id']) for r in self.search('marti')], [('book', self.book.id)])
+        self.assertEqual({r['type'] for r in self.search('village')}, {'author', 'review'})
+        self.assertEqual(self.search('zemaite')[0]['name'], 'Žemaitė')
+        self.assertEqual(self.search('dram')[0]['book_title'], 'Marti')
+
+    def test_index_follows_writes(self):
+        self.book.title = 'Topylis'
+        self.book.save()
+        self.assertEqual(self.search('marti'), [])
+        self.assertEqual(len(self.search('topylis')), 1)
+        self.book.delete()
+        self.assertEqual(self.search('drama'), [])
+
+    def test_type_filter_and_paging(self):
+        for i in range(5):
+            Review.objects.create(book=self.book, user=self.user, rating=5, review_text=f'village note {i}',
+                                  status=APPROVED)
+        page = self.client.get('/search/', {'q': 'village', 'type': 'review', 'page_size': 4}).json()
+        rest = self.client.get(page['next']).json()
+        ids = [r['id'] for r in page['results'] + rest['results']]
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(len(set(ids)), 6)
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM books_search')
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.search('marti')), 1)
+
+    def test_requires_query(self):
+        self.assertEqual(self.client.get('/search/', {'q': '  '}).status_code, 400)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=2, reviews_per_book=2)
+        self.book = Book.objects.order_by('id').first()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, len(ctx.captured_queries)
+
+    def test_second_read_is_served_from_cache(self):
+        first, _ = self.get(f'/books/{self.book.id}/')
+        second, queries = self.get(f'/books/{self.book.id}/')
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(queries, 0)
+        self.assertEqual(first.json(), second.json())
+
+    def test_review_write_expires_only_dependent_entries(self):
+        author_id = self.book.author_id
+        other_author = Author.objects.exclude(id=author_id).first()
+        urls = [f'/books/{self.book.id}/', f'/author/{author_id}/books/', '/books/', '/reviews/',
+                f'/author/{other_author.id}/books/']
+        for url in urls:
+            self.get(url)
+        Review.objects.create(book=self.book, user=self.user, rating=1, review_text='new', status=APPROVED)
+        states = [self.get(url)[0]['X-Cache'] for url in urls]
+        self.assertEqual(states, ['MISS', 'MISS', 'MISS', 'MISS', 'HIT'])
+        self.assertEqual(self.get(f'/books/{self.book.id}/')[0].json()['review_count'], 3)
+
+    def test_author_rename_expires_book_detail(self):
+        self.get(f'/books/{self.book.id}/')
+        Author.objects.filter(id=self.book.author_id).get().save()
+        self.assertEqual(self.get(f'/books/{self.book.id}/')[0]['X-Cache'], 'MISS')
+
+    def test_query_string_is_part_of_key(self):
+        self.get('/books/?page_size=1')
+        response, _ = self.get('/books/?page_size=2')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_host_and_scheme_are_part_of_key(self):
+        self.get('/books/?page_size=1')
+        response = self.client.get('/books/?page_size=1', HTTP_HOST='books.example.com', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['next'].startswith('https://books.example.com/books/'))
+
+    def test_versions_outlive_the_response_cache(self):
+        self.get('/books/')
+        versions = get_versions(['books'])
+        cache.clear()  # as culling a full response cache would
+        self.assertEqual(get_versions(['books']), versions)
+
+    def test_stats(self):
+        self.get('/authors/')
+        self.get('/authors/')
+        self.assertGreaterEqual(self.client.get('/cache-stats/').json()['hits'], 1)
+
+
+class ConditionalRequestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=1, books_per_author=2, reviews_per_book=2)
+        self.book = Book.objects.order_by('id').first()
+        self.url = f'/books/{self.book.id}/'
+
+    def test_not_modified_skips_the_view(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_review_write_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        review = self.book.reviews.first()
+        review.review_text = 'edited'
+        review.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        author_books = f'/author/{self.book.author_id}/books/'
+        etag = self.client.get(author_books)['ETag']
+        self.assertEqual(self.client.get(author_books, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book.delete()
+        self.assertEqual(self.client.get(author_books, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_embedded_review_edit_changes_author_books_etag(self):
+        url = f'/author/{self.book.author_id}/books/?include=reviews'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        review = self.book.reviews.first()
+        review.review_text = 'edited'
+        review.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('edited', [r['review_text'] for book in response.json()['results'] for r in book['reviews']])
+
+    def test_books_leaving_the_author_list_change_last_modified(self):
+        url = f'/author/{self.book.author_id}/books/'
+        other_author = Author.objects.create(name='Other', bio='')
+        second = Book.objects.exclude(id=self.book.id).get()
+
+        def last_modified():
+            # Last-Modified has a resolution of a second: start from an hour ago.
+            past = timezone.now() - datetime.timedelta(hours=1)
+            Author.objects.update(updated_at=past)
+            Book.objects.update(updated_at=past)
+            cache.clear()
+            value = self.client.get(url)['Last-Modified']
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=value).status_code, 304)
+            return value
+
+        since = last_modified()
+        item = {'title': second.title, 'author': other_author.id, 'publication_date': '2001-01-01',
+                'isbn': second.isbn}
+        self.assertEqual(self.client.post('/books/?upsert=isbn', [item], format='json').status_code, 201)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        back = dict(item, author=self.book.author_id)
+        self.assertEqual(self.client.put(f'/books/{second.id}/', back, format='json').status_code, 200)
+        since = last_modified()
+        self.assertEqual(self.client.put(f'/books/{second.id}/', item, format='json').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        since = last_modified()
+        self.assertEqual(self.client.delete(f'/books/{self.book.id}/').status_code, 204)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_author_and_batch_review_writes_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Author.objects.get(id=self.book.author_id).save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.url)['ETag']
+        review = self.book.reviews.first()
+        item = {'id': review.id, 'book': self.book.id, 'user': review.user_id, 'rating': review.rating,
+                'review_text': 'edited in a batch'}
+        self.assertEqual(self.client.post('/reviews/', [item], format='json').status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_if_match_on_put(self):
+        etag = self.client.get(self.url)['ETag']
+        data = {'title': 'Renamed', 'author': self.book.author_id,
+                'publication_date': '2001-01-01', 'isbn': self.book.isbn}
+        self.assertEqual(self.client.put(self.url, data, HTTP_IF_MATCH='"stale"').status_code, 412)
+        self.assertEqual(self.client.put(self.url, data, HTTP_IF_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.put(self.url, data, HTTP_IF_MATCH=etag).status_code, 412)
+
+
+class StreamingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=3, reviews_per_book=2)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_json_array(self):
+        with mock.patch('Backend.books.views.stream_response',
+                        wraps=lambda *args, **kwargs: stream_response(*args, chunk_size=4)):
+            response = self.client.get('/books/', {'stream': '1'})
+        data = json.loads(self.content(response))
+        self.assertEqual([b['id'] for b in data], list(Book.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(data[0]['author_name'], 'Author 0')
+
+    def test_ndjson(self):
+        response = self.client.get('/reviews/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self.content(response).decode().splitlines()
+        self.assertEqual(len(lines), Review.objects.count())
+        self.assertIn('creator', json.loads(lines[0]))
+
+    def test_empty(self):
+        author = Author.objects.create(name='New', bio='')
+        self.assertEqual(self.content(self.client.get(f'/author/{author.id}/books/', {'stream': '1'})), b'[]')
+
+
+class ImportCatalogTests(TestCase):
+    def test_import(self):
+        FullUser.objects.create(username='reader', gender='Other')
+        Book.objects.create(title='Old title', author=Author.objects.create(name='Existing', bio=''),
+                            publication_date=datetime.date(1990, 1, 1), isbn='111')
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / 'books.csv').write_text(
+                'title,author,publication_date,isbn\n'
+                'New title,Existing,1991-02-03,111\n'
+                'Second,Newcomer,2001-01-01,222\n'
+                'Broken,Newcomer,not-a-date,333\n')
+            (tmp / 'reviews.jsonl').write_text(
+                '{"isbn": "111", "username": "reader", "rating": 9, "review_text": "great",'
+                ' "created_at": "2020-05-01T10:00:00Z"}\n'
+                '{"isbn": "222", "username": "reader", "rating": 4, "review_text": "meh"}\n'
+                '{"isbn": "999", "username": "reader", "rating": 4, "review_text": "?"}\n'
+                '{"isbn": "222", "username": "nobody", "rating": 11}\n'
+                'not json\n')
+            call_command('import_catalog', books=str(tmp / 'books.csv'), reviews=str(tmp / 'reviews.jsonl'),
+                         rejects=str(tmp / 'rejects.jsonl'), batch_size=2, stdout=io.StringIO())
+            rejects = [json.loads(line) for line in (tmp / 'rejects.jsonl').read_text().splitlines()]
+
+        self.assertEqual(sorted((Path(r['file']).suffix, r['line']) for r in rejects),
+                         [('.csv', 4), ('.jsonl', 3), ('.jsonl', 4), ('.jsonl', 5)])
+        old = Book.objects.get(isbn='111')
+        self.assertEqual((old.title, old.publication_date, old.review_count), ('New title', datetime.date(1991, 2, 3), 1))
+        self.assertEqual(Book.objects.get(isbn='222').author.name, 'Newcomer')
+        self.assertEqual(old.reviews.get().created_at, datetime.datetime(2020, 5, 1, 10, tzinfo=datetime.timezone.utc))
+
+    def test_update_moves_updated_at(self):
+        book = Book.objects.create(title='Old title', author=Author.objects.create(name='Existing', bio=''),
+                                   publication_date=datetime.date(1990, 1, 1), isbn='111')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'books.csv'
+            path.write_text('title,author,publication_date,isbn\nNew title,Existing,1990-01-01,111\n')
+            call_command('import_catalog', books=str(path), rejects=str(Path(tmp) / 'rejects.jsonl'),
+                         stdout=io.StringIO())
+        self.assertGreater(Book.objects.get(id=book.id).updated_at, book.updated_at)
+
+
+class BatchWriteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=1, books_per_author=1, reviews_per_book=1)
+        self.author = Author.objects.get()
+        self.book = Book.objects.get()
+
+    def book_item(self, isbn, **kwargs):
+        return {'title': f'Book {isbn}', 'author': self.author.id, 'publication_date': '2020-01-01',
+                'isbn': isbn, **kwargs}
+
+    def test_create_books_in_constant_queries(self):
+        items = [self.book_item(f'isbn-{i}') for i in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/books/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(ctx.captured_queries), 12)
+        self.assertEqual(len(response.json()['results']), 50)
+        self.assertEqual(Book.objects.count(), 51)
+
+    def test_only_staff_write_books(self):
+        self.client.force_authenticate(FullUser.objects.create(username='reader', gender='Other'))
+        response = self.client.post('/books/', [self.book_item('isbn-1')], format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.put(f'/books/{self.book.id}/', self.book_item('isbn-2'),
+                                         format='json').status_code, 403)
+        self.assertEqual(self.client.delete(f'/books/{self.book.id}/').status_code, 403)
+        self.assertEqual(self.client.get(f'/books/{self.book.id}/').json()['isbn'], self.book.isbn)
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_errors_are_reported_per_item_and_nothing_is_written(self):
+        items = [self.book_item('ok'), self.book_item(self.book.isbn), self.book_item('x', author=999),
+                 self.book_item('ok'), {'title': 'incomplete'}]
+        response = self.client.post('/books/', items, format='json')
+        self.assertEqual(response.status_code, 422)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertEqual(list(errors[1]), ['isbn'])
+        self.assertEqual(list(errors[2]), ['author'])
+        self.assertEqual(list(errors[3]), ['isbn'])
+        self.assertIn('isbn', errors[4])
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_upsert_by_isbn(self):
+        items = [self.book_item(self.book.isbn, title='Renamed'), self.book_item('new')]
+        response = self.client.post('/books/?upsert=isbn', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([b['id'] for b in response.json()['results']][0], self.book.id)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, 'Renamed')
+
+    def test_upsert_moving_a_book_expires_the_previous_author(self):
+        url = f'/author/{self.author.id}/books/'
+        self.assertEqual(len(self.client.get(url).json()['results']), 1)
+        other = Author.objects.create(name='Other', bio='')
+        response = self.client.post('/books/?upsert=isbn', [self.book_item(self.book.isbn, author=other.id)],
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+    def test_reviews_create_and_update(self):
+        existing = Review.objects.get()
+        items = [{'book': self.book.id, 'user': self.user.id, 'rating': 10, 'review_text': 'new'},
+                 {'id': existing.id, 'book': self.book.id, 'user': existing.user_id, 'rating': 1, 'review_text': 'upd'}]
+        response = self.client.post('/reviews/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['pending', 'approved'])
+        run_pending()
+        self.book.refresh_from_db()
+        # The new review awaits moderation.
+        self.assertEqual((self.book.review_count, self.book.rating_sum), (1, 1))
+        self.assertEqual(Review.objects.get(id=existing.id).review_text, 'upd')
+
+    def test_batch_size_limit(self):
+        with self.settings(BATCH_WRITE_MAX_SIZE=2):
+            response = self.client.post('/books/', [self.book_item(str(i)) for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 413)
+
+
+class DatabaseTests(TransactionTestCase):
+    # Outside of TestCase, whose own transaction would keep every read on default.
+    def test_reads_go_to_the_replica_outside_transactions(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), 'replica')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Book), 'default')
+            self.assertEqual(router.db_for_write(Book), 'default')
+        self.assertEqual(router.db_for_read(Book), 'replica')
+        self.assertFalse(router.allow_migrate('replica', 'books'))
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        pragmas = {'journal_mode': 'WAL', **settings.SQLITE_PRAGMAS}
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseWrapper(dict(connection.settings_dict, NAME=str(Path(tmp) / 'db.sqlite3'),
+                                      PRAGMAS=pragmas), alias='pragmas')
+            try:
+                with db.cursor() as cursor:
+                    applied = {}
+                    for name in pragmas:
+                        cursor.execute(f'PRAGMA {name}')
+                        applied[name] = cursor.fetchone()[0]
+            finally:
+                db.close()
+        self.assertEqual(applied, {'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1,
+                                   'mmap_size': 268435456, 'cache_size': -65536, 'temp_store': 2})
+
+
+class ModerationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=1, books_per_author=2, reviews_per_book=2)
+        self.book, self.other = Book.objects.order_by('id')
+        for book in (self.book, self.other):
+            for rating in (2, 9, 10):
+                response = self.client.post('/reviews/', {'book': book.id, 'user': self.user.id, 'rating': rating,
+                                                          'review_text': 'pending verdict', 'status': 'approved'})
+                self.assertEqual(response.json()['status'], 'pending')
+        self.pending = list(Review.objects.filter(status=Review.Status.PENDING).order_by('id'))
+
+    def aggregates(self, book):
+        book.refresh_from_db()
+        return book.review_count, book.rating_sum, book.rating_histogram
+
+    def moderate(self, reviews, decision):
+        return self.client.post('/reviews/moderation/', {'ids': [r.id for r in reviews], 'status': decision},
+                                format='json')
+
+    def test_pending_reviews_are_hidden(self):
+        review = self.pending[0]
+        self.assertEqual(self.aggregates(self.book), (2, 3, [1, 1, 0, 0, 0, 0, 0, 0, 0, 0]))
+        self.assertNotIn(review.id, [r['id'] for r in self.client.get('/reviews/').json()['results']])
+        self.assertEqual(len(self.client.get(f'/books/{self.book.id}/').json()['reviews']), 2)
+        url = f'/author/{self.book.author_id}/book/{self.book.id}/reviews/{review.id}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get('/search/', {'q': 'verdict'}).json()['results'], [])
+
+    def test_bulk_decisions_in_one_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.moderate(self.pending, 'approved')
+        self.assertEqual(response.json(), {'updated': 6})
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "books_review"')]), 1)
+        self.assertEqual(self.aggregates(self.book), (5, 24, [1, 2, 0, 0, 0, 0, 0, 0, 1, 1]))
+        self.assertEqual(len(self.client.get('/search/', {'q': 'verdict'}).json()['results']), 6)
+
+        self.assertEqual(self.moderate(self.pending[:2] + [Review.objects.order_by('id').first()],
+                                       'rejected').json(), {'updated': 3})
+        self.assertEqual(self.aggregates(self.book), (2, 12, [0, 1, 0, 0, 0, 0, 0, 0, 0, 1]))
+        expected = [self.aggregates(book) for book in (self.book, self.other)]
+        call_command('rebuild_rating_aggregates', stdout=io.StringIO())
+        self.assertEqual([self.aggregates(book) for book in (self.book, self.other)], expected)
+        self.assertEqual(len(self.client.get('/search/', {'q': 'verdict'}).json()['results']), 4)
+
+    def test_queue_reads_the_pending_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            page = self.client.get('/reviews/moderation/?page_size=4').json()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + ctx.captured_queries[-1]['sql'])
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertIn('review_pending_idx', ' '.join(plan))
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+        self.assertEqual([r['id'] for r in page['results'] + self.client.get(page['next']).json()['results']],
+                         [r.id for r in self.pending])
+
+    def test_admin_actions(self):
+        admin = FullUser.objects.create(username='admin', gender='Other', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        response = self.client.post('/admin/books/review/', {'action': 'approve',
+                                                             '_selected_action': [r.id for r in self.pending]})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Review.objects.filter(status=Review.Status.PENDING).exists())
+        self.assertEqual(self.aggregates(self.other)[:2], (5, 24))
+
+    def test_staff_only_and_size_limit(self):
+        reader = FullUser.objects.get(username='reader0')
+        self.client.force_authenticate(reader)
+        self.assertEqual(self.moderate(self.pending, 'approved').status_code, 403)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.moderate(self.pending, 'deleted').status_code, 422)
+        with self.settings(MODERATION_MAX_BATCH_SIZE=2):
+            self.assertEqual(self.moderate(self.pending, 'approved').status_code, 413)
+
+
+class AdminTests(APITestCase):
+    # Queries per changelist page: session, user, row count (two when estimated) and the page itself.
+    budget = 5
+    urls = ['/admin/books/fulluser/', '/admin/books/fulluser/?q=read', '/admin/books/author/?q=author',
+            '/admin/books/book/', '/admin/books/book/?q=book', '/admin/books/book/?publication_date__gte=2001-01-01',
+            '/admin/books/review/', '/admin/books/review/?status__exact=approved', '/admin/books/review/?q=Book']
+
+    def setUp(self):
+        super().setUp()
+        self.admin = FullUser.objects.create(username='admin', gender='Other', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+
+    def changelist(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, ctx.captured_queries
+
+    def test_queries_do_not_grow_with_rows(self):
+        for size in (1, 4):
+            make_catalog(authors=size, books_per_author=size, reviews_per_book=size)
+            for user in FullUser.objects.all():
+                Token.objects.get_or_create(user=user)
+            for url in self.urls:
+                with self.subTest(url=url, size=size):
+                    _, queries = self.changelist(url)
+                    self.assertLessEqual(len(queries), self.budget, '\n'.join(q['sql'] for q in queries))
+            FullUser.objects.exclude(pk__in=[self.user.pk, self.admin.pk]).delete()
+            Author.objects.all().delete()
+
+    def test_estimated_count(self):
+        make_catalog(authors=2, books_per_author=2, reviews_per_book=2)
+        Review.objects.order_by('id')[3].delete()
+        with self.settings(ADMIN_COUNT_LIMIT=3):
+            response, queries = self.changelist('/admin/books/review/')
+            # The span of the ids: counts the deleted review too.
+            self.assertEqual(response.context['cl'].result_count, 8)
+            self.assertFalse([q for q in queries if q['sql'] == 'SELECT COUNT(*) FROM "books_review"'])
+            response, _ = self.changelist('/admin/books/review/?status__exact=approved')
+            self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertEqual(self.changelist('/admin/books/review/')[0].context['cl'].result_count, 7)
+
+    def test_search_reads_indexes(self):
+        make_catalog(authors=2, books_per_author=2, reviews_per_book=2)
+        for url, expected in (('/admin/books/review/?q=Book 1-', 4), ('/admin/books/review/?q=reader1', 4),
+                              ('/admin/books/book/?q=book', 4), ('/admin/books/author/?q=author', 2)):
+            with self.subTest(url=url):
+                response, queries = self.changelist(url)
+                self.assertEqual(response.context['cl'].result_count, expected)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+                    plan = [row[-1] for row in cursor.fetchall()]
+                self.assertFalse([step for step in plan if step.startswith('SCAN') and 'INDEX' not in step
+                                  and 'VIRTUAL TABLE' not in step], plan)
+
+
+calls = []
+
+
+@task('test_record')
+def record(target, payload):
+    if payload.get('fail'):
+        raise RuntimeError('broken')
+    calls.append(target)
+
+
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+        make_catalog(authors=1, books_per_author=2, reviews_per_book=2)
+        run_pending()
+
+    def test_coalesces_and_keys(self):
+        enqueue_many('test_record', [1, 1, 2])
+        enqueue('test_record', 1)
+        enqueue('test_record', 3, key='once')
+        enqueue('test_record', 4, key='once')
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(sorted(calls), ['1', '2', '3'])
+        enqueue('test_record', 3, key='once')
+        self.assertEqual(run_pending(), 0)
+        with self.assertRaises(ValueError):
+            enqueue('no_such_task')
+
+    def test_enqueued_with_the_write(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue('test_record', 1)
+            raise RuntimeError
+        self.assertFalse(Job.objects.filter(task='test_record').exists())
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_retries_with_backoff(self):
+        enqueue('test_record', 1, payload={'fail': True})
+        with self.assertLogs('Backend.books.jobs', 'ERROR'):
+            run_pending()
+        job = Job.objects.get(task='test_record')
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError: broken', job.last_error)
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(task='test_record').update(run_at=timezone.now())
+        with self.assertLogs('Backend.books.jobs', 'ERROR'):
+            run_pending()
+        self.assertEqual(Job.objects.get(task='test_record').status, Job.Status.FAILED)
+
+    def test_expired_lease_is_taken_over(self):
+        enqueue('test_record', 1)
+        Job.objects.filter(task='test_record').update(status=Job.Status.RUNNING, attempts=1,
+                                                      locked_until=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual((calls, Job.objects.get(task='test_record').attempts), (['1'], 2))
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_lease_taken_over_within_the_attempts(self):
+        enqueue('test_record', 1)
+        Job.objects.filter(task='test_record').update(status=Job.Status.RUNNING, attempts=2,
+                                                      locked_until=timezone.now())
+        self.assertEqual(run_pending(), 0)
+        job = Job.objects.get(task='test_record')
+        self.assertEqual((calls, job.status, job.attempts), ([], Job.Status.FAILED, 2))
+        self.assertIn('lease ran out', job.last_error)
+
+    def test_deletes_are_immediate(self):
+        book, other = Book.objects.order_by('id')
+        self.assertEqual(self.client.delete(f'/books/{book.id}/').status_code, 204)
+        self.assertEqual(self.client.get(f'/books/{book.id}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/authors/{book.author_id}/').status_code, 204)
+        self.assertFalse(Author.objects.exists() or Book.objects.exists() or Review.objects.exists())
+        self.assertEqual(self.client.get(f'/books/{other.id}/').status_code, 404)
+
+    def test_worker_needs_a_shared_cache(self):
+        enqueue('test_record', 1)
+        with self.assertRaises(CommandError):
+            call_command('run_workers', '--once', '--threads', '0', stdout=io.StringIO())
+        call_command('run_workers', '--once', '--threads', '0', '--local-cache', stdout=io.StringIO())
+        self.assertEqual(calls, ['1'])
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principals.clear()
+        self.user = FullUser.objects.create_user(username='staff', password='secret', gender='Other',
+                                                 email='staff@example.com', is_staff=True)
+        make_catalog(authors=1, books_per_author=1, reviews_per_book=1)
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/token/', {'username': 'staff', 'password': 'secret'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.json()["access"]}')
+
+    def test_reads_need_no_auth_queries(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CACHES={alias: {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': f'{directory}/{alias}'}
+                for alias in ('default', 'versions')}):
+            self.login()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/authors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_claims_not_trusted_with_a_local_cache(self):
+        self.login()
+        # Demoted by another process: this one's cache never sees the version bump.
+        FullUser.objects.filter(pk=self.user.pk).update(is_staff=False)
+        principals.clear()
+        self.assertEqual(self.client.post('/authors/', {'name': 'New', 'bio': 'Bio'}, format='json').status_code, 403)
+
+    def test_user_details_and_staff_checks(self):
+        self.login()
+        self.assertEqual(self.client.get('/user-details/').json()['email'], 'staff@example.com')
+        self.assertEqual(self.client.post('/authors/', {'name': 'New', 'bio': 'Bio'}, format='json').status_code, 201)
+
+    def test_changed_user_is_reloaded(self):
+        self.login()
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.post('/authors/', {'name': 'New', 'bio': 'Bio'}, format='json').status_code, 403)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/authors/').status_code, 401)
+
+    def test_tokens_without_claims_use_principal_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(self.client.get('/authors/').status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/authors/?page_size=1')
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+@override_settings(ROOT_URLCONF='Backend.asgi_urls')
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=2, reviews_per_book=3)
+        review = Review.objects.order_by('id').first()
+        self.urls = [url.format(author=review.book.author_id, book=review.book_id, review=review.id)
+                     for url, _ in QueryBudgetTests.budgets.values()] + ['/user-details/']
+
+    def test_matches_sync_views(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with override_settings(ROOT_URLCONF='Backend.urls'):
+                    cache.clear()
+                    self.assertEqual(response.json(), self.client.get(url).json())
+
+    def test_conditional_and_cached(self):
+        url = self.urls[1]
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_export_and_writes(self):
+        self.assertEqual(len(self.client.get('/reviews/?stream=1').json()), Review.objects.count())
+        response = self.client.post('/authors/', {'name': 'New', 'bio': 'Bio'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(f'/authors/{response.json()["id"]}/').json()['name'], 'New')
+        self.assertEqual(self.client.get('/authors/999/').status_code, 404)
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        make_catalog(authors=2, books_per_author=2, reviews_per_book=2)
+        Book.objects.create(title='Unreviewed', author=Author.objects.first(), publication_date='2001-02-03',
+                            isbn='unreviewed')
+
+    def assertSameJSON(self, plan, queryset, serializer_class):
+        render = JSONRenderer().render
+        self.assertEqual(render(plan.serialize(plan.values(queryset))),
+                         render(serializer_class(queryset, many=True).data))
+
+    def test_matches_drf_output(self):
+        self.assertSameJSON(author_list, Author.objects.order_by('id'), AuthorSerializer)
+        self.assertSameJSON(book_list, Book.objects.select_related('author').order_by('id'), BookListSerializer)
+        reviews = Review.objects.select_related('book', 'user').order_by('id')
+        self.assertSameJSON(review_list, reviews, ReviewListSerializer)
+        with timezone.override('Europe/Vilnius'):
+            self.assertSameJSON(review_list, reviews, ReviewListSerializer)
+
+
+class RendererTests(TestCase):
+    payload = OrderedDict([
+        ('created_at', datetime.datetime(2023, 5, 1, 12, 30, 15, 250, tzinfo=datetime.timezone.utc)),
+        ('local', timezone.localtime(timezone.now(), zoneinfo.ZoneInfo('Europe/Vilnius'))),
+        ('publication_date', datetime.date(1999, 12, 31)),
+        ('price', Decimal('12.50')),
+        ('review_text', 'Ąžuolas \u2028 line \u2029 "quoted"'),
+        ('nested', [{'rating': 7, 'average': 7.33, 'missing': None}]),
+    ])
+
+    def test_renderer_matches_drf(self):
+        expected = JSONRenderer().render(self.payload)
+        self.assertEqual(ORJSONRenderer().render(self.payload), expected)
+        # orjson refuses integers wider than 64 bits; the stdlib renderer takes over.
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+        with mock.patch('Backend.books.renderers.orjson', None):
+            self.assertEqual(ORJSONRenderer().render(self.payload), expected)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parser_matches_drf(self):
+        body = json.dumps({'rating': 7, 'review_text': 'Ąžuolas', 'big': 2 ** 70}).encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError) as expected:
+            JSONParser().parse(io.BytesIO(b'{"rating": NaN}'))
+        with self.assertRaises(ParseError) as raised:
+            ORJSONParser().parse(io.BytesIO(b'{"rating": NaN}'))
+        self.assertEqual(str(raised.exception), str(expected.exception))
+
+    def test_api_responses(self):
+        make_catalog(authors=1, books_per_author=1, reviews_per_book=2)
+        client = APIClient()
+        client.force_authenticate(FullUser.objects.create(username='staff', gender='Other', is_staff=True))
+        response = client.get('/reviews/')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+
+class FieldSelectionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=1, books_per_author=3, reviews_per_book=2)
+        self.book = Book.objects.order_by('id').first()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [q['sql'] for q in ctx.captured_queries]
+
+    def test_fields_narrow_output_and_columns(self):
+        data, queries = self.get('/books/?fields=title,isbn&page_size=2')
+        self.assertEqual([list(item) for item in data['results']], [['title', 'isbn']] * 2)
+        self.assertNotIn('rating_histogram', queries[-1])
+        self.assertNotIn('books_author', queries[-1])
+        following, _ = self.get(data['next'])
+        self.assertEqual([item['title'] for item in following['results']], ['Book 0-2'])
+
+    def test_default_output_unchanged(self):
+        data, _ = self.get(f'/books/{self.book.id}/')
+        self.assertEqual(list(data), list(BookDetailSerializer(self.book).data))
+        self.assertEqual(len(data['reviews']), 2)
+
+    def test_include_builds_the_fetch_plan(self):
+        data, queries = self.get(f'/books/{self.book.id}/?include=')
+        self.assertEqual(list(data), ['id', 'title', 'publication_date', 'isbn', 'author'])
+        self.assertFalse(any('books_review' in sql and 'books_book' not in sql for sql in queries))
+        data, _ = self.get(f'/books/{self.book.id}/?include=reviews&fields=title,reviews')
+        self.assertEqual((list(data), len(data['reviews'])), (['title', 'reviews'], 2))
+        data, _ = self.get('/reviews/?include=user&fields=id,creator')
+        self.assertEqual(list(data['results'][0]), ['id', 'creator'])
+
+    def test_invalid_selection(self):
+        for url in ('/books/?include=publisher', '/books/?fields=title,reviews', '/authors/?include=books',
+                    '/reviews/?fields=creator&include=book', '/books/?stream=1&include=reviews'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class CompressionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog(authors=2, books_per_author=3, reviews_per_book=4)
+
+    def test_negotiation(self):
+        with mock.patch('Backend.books.compression.available_encodings', return_value=['br', 'gzip']):
+            self.assertEqual(negotiate('gzip, br'), 'br')
+            self.assertEqual(negotiate('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(negotiate('*'), 'br')
+            self.assertEqual(negotiate('*, br;q=0'), 'gzip')
+        with mock.patch('Backend.books.compression.available_encodings', return_value=['gzip']):
+            self.assertEqual(negotiate('br, gzip;q=0.1'), 'gzip')
+            self.assertIsNone(negotiate('gzip;q=0'))
+            self.assertIsNone(negotiate('identity'))
+            self.assertIsNone(negotiate(''))
+
+    @mock.patch('Backend.books.compression.available_encodings', return_value=['gzip'])
+    def test_gzip_and_cached_variant(self, _):
+        plain = self.client.get('/reviews/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        first = self.client.get('/reviews/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((first['Content-Encoding'], first['X-Cache']), ('gzip', 'HIT'))
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+        self.assertEqual(first['Content-Length'], str(len(first.content)))
+        with mock.patch('Backend.books.middleware.compress') as compress:
+            second = self.client.get('/reviews/', HTTP_ACCEPT_ENCODING='gzip')
+        compress.assert_not_called()
+        self.assertEqual((second.content, second['Content-Encoding']), (first.content, 'gzip'))
+        self.assertIn('Accept-Encoding', second['Vary'])
+        self.assertEqual(self.client.get('/reviews/').content, plain.content)
+
+    @mock.patch('Backend.books.compression.available_encodings', return_value=['gzip'])
+    def test_html_pages_are_not_compressed(self, _):
+        # The admin login page carries a CSRF token: compressing it would expose it to BREACH.
+        response = APIClient().get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.content), 1024)
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_small_and_streamed_bodies(self):
+        small = self.client.get('/authors/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(small.content), 1024)
+        self.assertNotIn('Content-Encoding', small)
+        self.assertIn('Accept-Encoding', small['Vary'])
+
+        with mock.patch('Backend.books.compression.available_encodings', return_value=['gzip']):
+            response = self.client.get('/reviews/?stream=1', HTTP_ACCEPT_ENCODING='gzip')
+            body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(body)), Review.objects.count())
+
+
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        make_catalog()
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/books/')
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(list(timings), ['db', 'serialize', 'total'])
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timings['db'])
+
+    def test_metrics_endpoint(self):
+        self.client.get('/books/')
+        self.client.get('/books/?page_size=1')
+        self.client.get('/reviews/')
+        self.client.generic('PURGE', '/books/')
+        self.client.generic('BREW', '/books/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 401)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        self.client.force_login(self.user)
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('books_request_duration_seconds_count{route="book-list",method="GET"} 2', body)
+        self.assertIn('books_request_duration_seconds_bucket{route="review-list",method="GET",le="+Inf"} 1', body)
+        self.assertIn('books_request_db_queries_total{route="book-list",method="GET"}', body)
+        self.assertIn('books_request_duration_seconds_count{route="book-list",method="other"} 2', body)
+        self.assertNotIn('PURGE', body)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('Backend.books.metrics', 'WARNING') as logs:
+            self.client.get('/reviews/')
+        self.assertIn('(review-list)', logs.output[0])
+        self.assertIn('FROM "books_review"', logs.output[0])
+
+
+class SeedAndBenchmarkTests(APITestCase):
+    def seed(self, **options):
+        call_command('seed_scale', authors=3, books=20, reviews=300, seed=7, stdout=io.StringIO(), **options)
+        return list(Book.objects.order_by('isbn').values_list('isbn', 'title', 'review_count', 'rating_sum'))
+
+    def test_seed_is_deterministic_and_valid(self):
+        books = self.seed()
+        self.assertEqual((Author.objects.count(), len(books), Review.objects.count()), (3, 20, 300))
+        self.assertEqual(sum(book[2] for book in books), 300)
+        for isbn, *_ in books:
+            self.assertEqual(sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(isbn)) % 10, 0)
+        self.assertEqual(len({book[0] for book in books}), 20)
+        self.assertTrue(self.client.get('/search/?q=loved').json()['results'])
+        with self.assertRaises(CommandError):
+            self.seed()
+        first, second = Book.objects.order_by('id')[:2]
+        BookSimilarity.objects.create(book=first, similar=second, score=1)
+        enqueue('refresh_rankings', first.id)
+        self.assertEqual(self.seed(flush=True), books)
+        self.assertFalse(BookSimilarity.objects.exists() or Job.objects.exists())
+
+    def test_bench_api_report_and_baseline(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as tmp:
+            report = Path(tmp) / 'report.json'
+            call_command('bench_api', requests=3, concurrency=1, warmup=1, route=['book-list', 'review-single'],
+                         output=str(report), stdout=io.StringIO(), stderr=io.StringIO())
+            routes = json.loads(report.read_text())['routes']
+            self.assertEqual(sorted(routes), ['author/<int:author_id>/books/', 'books/', 'reviews/<int:review_id>/'])
+            self.assertEqual((routes['books/']['errors'], routes['books/']['queries']), (0, 1))
+
+            routes['books/']['queries'] = 0
+            report.write_text(json.dumps({'routes': routes}))
+            with self.assertRaisesMessage(CommandError, 'books/: 1 queries (was 0)'):
+                call_command('bench_api', requests=3, concurrency=1, route=['book-list'], baseline=str(report),
+                             tolerance=100, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        make_catalog()
+
+    def test_off_by_default(self):
+        with mock.patch('Backend.books.profiling.StackSampler') as sampler:
+            response = self.client.get('/reviews/')
+        sampler.assert_not_called()
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_staff_header_profile(self):
+        serialize = CompiledSerializer.serialize
+
+        def slow_serialize(plan, rows):
+            time.sleep(0.05)  # long enough for the sampler to see the view
+            return serialize(plan, rows)
+
+        with mock.patch.object(CompiledSerializer, 'serialize', slow_serialize):
+            response = self.client.get('/reviews/', HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+        self.assertEqual([p['id'] for p in self.client.get('/profiles/').json()], [profile_id])
+
+        detail = self.client.get(f'/profiles/{profile_id}/').json()
+        self.assertEqual((detail['route'], detail['trigger'], detail['status']), ('review-list', 'header', 200))
+        self.assertEqual(detail['query_count'], len(detail['queries']))
+        self.assertIn('FROM "books_review"', detail['queries'][-1]['sql'])
+        self.assertTrue(detail['functions'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'profile.pstats'
+            path.write_bytes(self.client.get(f'/profiles/{profile_id}/pstats/').content)
+            self.assertGreater(pstats.Stats(str(path)).total_calls, 0)
+        speedscope = self.client.get(f'/profiles/{profile_id}/speedscope/').json()
+        frames = speedscope['shared']['frames']
+        self.assertIn('slow_serialize', {frame['name'] for frame in frames})
+        self.assertGreater(speedscope['profiles'][0]['endValue'], 0.04)
+        self.assertEqual(self.client.get(f'/profiles/{profile_id}/svg/').status_code, 404)
+
+    def test_header_ignored_for_other_users(self):
+        reader = FullUser.objects.get(username='reader0')
+        client = APIClient(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(reader).access_token}')
+        self.assertNotIn('X-Profile-Id', client.get('/reviews/', HTTP_X_PROFILE='1'))
+        self.assertEqual(client.get('/profiles/').status_code, 403)
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            self.assertIn('X-Profile-Id', client.get('/reviews/'))
@@ -1,18 +1,39 @@
+import hmac
 import json
+import marshal
 import requests
 
 import pytz
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import JsonResponse, Http404
+from django.db.models import F
+from django.http import HttpResponse, JsonResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics, status, permissions
-from rest_framework.permissions import IsAuthenticated, BasePermission
+from rest_framework.permissions import IsAuthenticated, BasePermission, SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from Backend.books.models import FullUser, Author, Book, Review
-from Backend.books.serializers import UserSerializer, AuthorSerializer, BookSerializer, ReviewSerializer
+from Backend.books.batch import write_books, write_reviews
+from Backend.books.cache import cache_response, stats as cache_stats
+from Backend.books.conditional import conditional, conditional_get, validated, latest, author_books_state, \
+    author_validators, book_validators, review_validators
+from Backend.books.fieldsets import AUTHOR, BOOK, REVIEW, BOOK_LIST_INCLUDE, BOOK_DETAIL_INCLUDE, \
+    REVIEW_LIST_INCLUDE, REVIEW_DETAIL_INCLUDE, book_reviews, embed_reviews, streamable
+from Backend.books.filters import BOOKS, LEADERBOARDS, REVIEWS
+from Backend.books.leaderboards import decayed_count
+from Backend.books.metrics import registry as metrics_registry
+from Backend.books.moderation import get_max_moderation_size, moderate
+from Backend.books import profiling
+from Backend.books.models import FullUser, Author, Book, BookRanking, Review
+from Backend.books.pagination import AuthorPagination, BookPagination, LeaderboardPagination, ModerationPagination, \
+    ReviewPagination
+from Backend.books.search import KINDS, SearchPagination, build_match_expression, hydrate
+from Backend.books.streaming import NDJSONRenderer, stream_response, wants_stream
+from Backend.books.serializers import UserSerializer, AuthorSerializer, BookSerializer, ReviewSerializer, \
+    ModerationSerializer
 from rest_framework.views import APIView
 
 
@@ -25,6 +46,15 @@ class IsStaffPermission(BasePermission):
             return True
 
 
+class StaffWritesMixin:
+    """Anyone authenticated reads, only staff write. Checked before the handler runs."""
+
+    def get_permissions(self):
+        if self.request.method in SAFE_METHODS:
+            return super().get_permissions()
+        return [IsAuthenticated(), IsStaffPermission()]
+
+
 class UserDetailsView(APIView):
     def get(self, request):
         user = request.user
@@ -51,26 +81,29 @@ class UserRegistrationView(generics.CreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class AuthorView(APIView):
+class AuthorView(StaffWritesMixin, APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = AuthorPagination
 
+    def get_cache_scopes(self, author_id=None):
+        return [f'author:{author_id}'] if author_id else ['authors']
+
+    @conditional_get
+    @cache_response
     def get(self, request, author_id=None):
+        fields = AUTHOR.select(request)
         if author_id:
-            try:
-                author = Author.objects.get(pk=author_id)
-                serializer = AuthorSerializer(author)
-                return Response(serializer.data)
-            except Author.DoesNotExist:
+            row = AUTHOR.values(Author.objects.filter(pk=author_id), fields, 'updated_at').first()
+            if row is None:
                 return Response(status=status.HTTP_404_NOT_FOUND)
+            return validated(request, Response(AUTHOR.serialize([row], fields)[0]), row['updated_at'])
         else:
-            authors = Author.objects.all()
-            serializer = AuthorSerializer(authors, many=True)
-            return Response(serializer.data)
+            paginator = self.pagination_class()
+            authors = AUTHOR.values(Author.objects.all(), fields, *paginator.get_ordering_fields())
+            authors = paginator.paginate_queryset(authors, request, view=self)
+            return paginator.get_paginated_response(AUTHOR.serialize(authors, fields))
 
     def post(self, request):
-        self.permission_classes = [IsStaffPermission]
-        if not request.user.is_staff:
-            return Response(status=status.HTTP_403_FORBIDDEN)
         # Create a new author
         serializer = AuthorSerializer(data=request.data)
         if serializer.is_valid():
@@ -78,9 +111,8 @@ class AuthorView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+    @conditional(author_validators)
     def put(self, request, author_id):
-        self.permission_classes = [IsAuthenticated, IsStaffPermission]
-
         try:
             author = Author.objects.get(pk=author_id)
         except Author.DoesNotExist:
@@ -93,8 +125,6 @@ class AuthorView(APIView):
         return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
     def delete(self, request, author_id):
-        self.permission_classes = [IsAuthenticated, IsStaffPermission]
-
         try:
             author = Author.objects.get(pk=author_id)
         except Author.DoesNotExist:
@@ -104,54 +134,68 @@ class AuthorView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class BookView(APIView):
+class BookView(StaffWritesMixin, APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = BookPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
 
-    def get(self, request, book_id=None, author_id=None):
+    def get_cache_scopes(self, book_id=None, author_id=None):
         if book_id:
-            try:
-                book = Book.objects.get(pk=book_id)
-                book_serializer = BookSerializer(book)
-                review_queryset = Review.objects.filter(book=book)
-                review_serializer = ReviewSerializer(review_queryset, many=True)
-
-                serialized_book = book_serializer.data
+            return [f'book:{book_id}']
+        return [f'author:{author_id}'] if author_id else ['books']
 
-                serialized_book['author_name'] = book.author.name
-                serialized_book['reviews'] = review_serializer.data
-
-                return Response(serialized_book)
-            except Book.DoesNotExist:
+    @conditional_get
+    @cache_response
+    def get(self, request, book_id=None, author_id=None):
+        if book_id:
+            fields = BOOK.select(request, BOOK_DETAIL_INCLUDE)
+            rows = list(BOOK.values(Book.objects.filter(pk=book_id), fields, 'id', 'updated_at'))
+            if not rows:
                 return Response(status=status.HTTP_404_NOT_FOUND)
+            data = BOOK.serialize(rows, fields)
+            if 'reviews' in fields:
+                embed_reviews(data, rows, book_reviews([book_id]))
+            return validated(request, Response(data[0]), rows[0]['updated_at'])
         else:
+            fields = BOOK.select(request, BOOK_LIST_INCLUDE)
             books = Book.objects.all()
+            state = None
             if author_id:
-                try:
-                    author = Author.objects.get(id=author_id)
-                except:
+                state = author_books_state(author_id)
+                if state is None:
                     return Response(status=status.HTTP_404_NOT_FOUND)
                 books = books.filter(author_id=author_id)
 
-            data = []
-            for book in books:
-                serializer = BookSerializer(book)
-                book_data = serializer.data
-                book_data['author_name'] = book.author.name
-                data.append(book_data)
-
-            return Response(data)
+            books = BOOKS.filter(books, request)
+            ordering = BOOKS.ordering(request)
+
+            if wants_stream(request):
+                books = books.order_by(*ordering)
+                return stream_response(request, books, streamable(BOOK, fields))
+
+            paginator = self.pagination_class(ordering)
+            books = BOOK.values(books, fields, *paginator.get_ordering_fields())
+            rows = paginator.paginate_queryset(books, request, view=self)
+            data = BOOK.serialize(rows, fields)
+            if 'reviews' in fields:
+                embed_reviews(data, rows, book_reviews([row['id'] for row in rows]))
+            response = paginator.get_paginated_response(data)
+            if state is not None:
+                updated_at, last_book, books_count = state
+                response = validated(request, response, latest(updated_at, last_book), books_count)
+            return response
 
     def post(self, request, author_id=None):
-        self.permission_classes = [IsAuthenticated, IsStaffPermission]
+        if isinstance(request.data, list):
+            return write_books(request.data, upsert=request.query_params.get('upsert') == 'isbn')
         serializer = BookSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+    @conditional(book_validators)
     def put(self, request, book_id, author_id=None):
-        self.permission_classes = [IsAuthenticated, IsStaffPermission]
-
         try:
             book = Book.objects.get(pk=book_id)
         except Book.DoesNotExist:
@@ -164,8 +208,6 @@ class BookView(APIView):
         return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
     def delete(self, request, book_id, author_id=None):
-        self.permission_classes = [IsAuthenticated, IsStaffPermission]
-
         try:
             book = Book.objects.get(pk=book_id)
         except Book.DoesNotExist:
@@ -177,43 +219,55 @@ class BookView(APIView):
 
 class ReviewView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = ReviewPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+    def get_cache_scopes(self, review_id=None, author_id=None, book_id=None):
+        if review_id and book_id:
+            return [f'review:{review_id}', f'book:{book_id}']
+        return [f'book:{book_id}'] if book_id else ['reviews']
 
+    @conditional_get
+    @cache_response
     def get(self, request, review_id=None, author_id=None, book_id=None):
         if review_id and author_id and book_id:
-            try:
-                review = Review.objects.get(pk=review_id)
-                serializer = ReviewSerializer(review)
-                data = serializer.data
-                data['book_title'] = review.book.title
-                return Response(data)
-            except Review.DoesNotExist:
+            fields = REVIEW.select(request, REVIEW_DETAIL_INCLUDE)
+            row = REVIEW.values(Review.objects.filter(pk=review_id, status=Review.Status.APPROVED), fields,
+                                'updated_at', 'book__updated_at').first()
+            if row is None:
                 return Response(status=status.HTTP_404_NOT_FOUND)
+            return validated(request, Response(REVIEW.serialize([row], fields)[0]),
+                             latest(row['updated_at'], row['book__updated_at']))
         else:
-            reviews = Review.objects.all()
+            fields = REVIEW.select(request, REVIEW_LIST_INCLUDE)
+            reviews = Review.objects.filter(status=Review.Status.APPROVED)
             if author_id and book_id:
-                try:
-                    book = Book.objects.get(id=book_id)
-                except:
+                if not Book.objects.filter(id=book_id).exists():
                     return Response(status=status.HTTP_404_NOT_FOUND)
-                reviews = reviews.filter(book_id=book.id)
+                reviews = reviews.filter(book_id=book_id)
+
+            reviews = REVIEWS.filter(reviews, request)
+            ordering = REVIEWS.ordering(request, ('book',) if book_id else ())
 
-            data = []
-            for review in reviews:
-                serializer = ReviewSerializer(review)
-                review_data = serializer.data
-                review_data['book_title'] = review.book.title
-                review_data['creator'] = review.user.username
+            if wants_stream(request):
+                reviews = reviews.order_by(*ordering)
+                return stream_response(request, reviews, streamable(REVIEW, fields))
 
-                data.append(review_data)
-            return Response(data)
+            paginator = self.pagination_class(ordering)
+            reviews = REVIEW.values(reviews, fields, *paginator.get_ordering_fields())
+            reviews = paginator.paginate_queryset(reviews, request, view=self)
+            return paginator.get_paginated_response(REVIEW.serialize(reviews, fields))
 
     def post(self, request, author_id=None, book_id=None):
+        if isinstance(request.data, list):
+            return write_reviews(request.data)
         serializer = ReviewSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+    @conditional(review_validators)
     def put(self, request, review_id, author_id=None, book_id=None):
         try:
             review = Review.objects.get(pk=review_id)
@@ -236,6 +290,131 @@ class ReviewView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ModerationView(APIView):
+    permission_classes = [IsAuthenticated, IsStaffPermission]
+    pagination_class = ModerationPagination
+
+    def get(self, request):
+        # The queue, oldest first: a range of the partial index on pending reviews.
+        fields = REVIEW.select(request, REVIEW_LIST_INCLUDE)
+        paginator = self.pagination_class()
+        reviews = REVIEW.values(Review.objects.filter(status=Review.Status.PENDING), fields,
+                                *paginator.get_ordering_fields())
+        reviews = paginator.paginate_queryset(reviews, request, view=self)
+        return paginator.get_paginated_response(REVIEW.serialize(reviews, fields))
+
+    def post(self, request):
+        serializer = ModerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        ids = serializer.validated_data['ids']
+        if len(ids) > get_max_moderation_size():
+            return Response({'detail': f'At most {get_max_moderation_size()} reviews can be moderated at once.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        updated = moderate(Review.objects.filter(id__in=ids), serializer.validated_data['status'])
+        return Response({'updated': updated})
+
+
+class SimilarBooksView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_cache_scopes(self, book_id):
+        return ['similar', 'books']
+
+    @cache_response
+    def get(self, request, book_id):
+        fields = BOOK.select(request, BOOK_LIST_INCLUDE)
+        # One range of the (book, -score) index, joined to the neighbours.
+        books = (Book.objects.filter(neighbour_of__book_id=book_id)
+                 .annotate(similarity=F('neighbour_of__score')).order_by('-similarity', 'id'))
+        rows = list(BOOK.values(books, fields, 'id', 'similarity'))
+        if not rows and not Book.objects.filter(id=book_id).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        data = BOOK.serialize(rows, fields)
+        if 'reviews' in fields:
+            embed_reviews(data, rows, book_reviews([row['id'] for row in rows]))
+        for item, row in zip(data, rows):
+            item['similarity'] = round(row['similarity'], 3)
+        return Response({'results': data})
+
+
+class LeaderboardView(APIView):
+    permission_classes = [IsAuthenticated]
+    pagination_class = LeaderboardPagination
+
+    def get_cache_scopes(self, board):
+        return ['leaderboards', 'books']
+
+    @cache_response
+    def get(self, request, board):
+        if board not in BookRanking.Board.values:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        fields = BOOK.select(request, BOOK_LIST_INCLUDE)
+        rankings = LEADERBOARDS.filter(BookRanking.objects.filter(board=board), request)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rankings.values('book_id', 'score'), request, view=self)
+
+        books = {row['id']: row for row in BOOK.values(Book.objects.filter(id__in=[e['book_id'] for e in page]),
+                                                       fields, 'id')}
+        rows = [books[entry['book_id']] for entry in page]
+        data = BOOK.serialize(rows, fields)
+        if 'reviews' in fields:
+            embed_reviews(data, rows, book_reviews([row['id'] for row in rows]))
+        for item, entry in zip(data, page):
+            # Top rated: the smoothed mean rating. Trending: the decayed review count.
+            score = entry['score'] if board == BookRanking.Board.TOP_RATED else decayed_count(entry['score'])
+            item['score'] = round(score, 3)
+        return paginator.get_paginated_response(data)
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAuthenticated, IsStaffPermission]
+
+    def get(self, request):
+        return Response(cache_stats.as_dict())
+
+
+class ProfileView(APIView):
+    permission_classes = [IsAuthenticated, IsStaffPermission]
+
+    def get(self, request, profile_id=None, kind=None):
+        if profile_id is None:
+            return Response(profiling.recent())
+        profile = profiling.load(profile_id)
+        if profile is None:
+            raise Http404
+        samples = profile.pop('samples')
+        if kind is None:
+            return Response(dict(profile, functions=profiling.top_functions(profiling.pstats_data(samples))))
+        if kind == 'pstats':
+            response = HttpResponse(marshal.dumps(profiling.pstats_data(samples)),
+                                    content_type='application/octet-stream')
+        elif kind == 'speedscope':
+            response = JsonResponse(profiling.speedscope(samples, f'{profile["method"]} {profile["path"]}'))
+        else:
+            raise Http404
+        extension = 'pstats' if kind == 'pstats' else 'speedscope.json'
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.{extension}"'
+        return response
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchPagination
+
+    def get(self, request):
+        expression = build_match_expression(request.query_params.get('q', ''))
+        if expression is None:
+            return Response({'q': ['A search query is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        kind = request.query_params.get('type')
+        if kind is not None and kind not in KINDS:
+            return Response({'type': [f'Must be one of: {", ".join(KINDS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = self.pagination_class()
+        rows = paginator.paginate_search(expression, request, kind=kind)
+        return paginator.get_paginated_response(hydrate(rows))
+
+
 def custom404(request, exception=None):
     return JsonResponse({
         'status_code': 404,
@@ -248,6 +427,18 @@ class NotFoundView(APIView):
         Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+def metrics(request):
+    # Open to scrapers with the token and to staff sessions; without a token only in DEBUG.
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG
+    if not (allowed or request.user.is_staff):
+        return JsonResponse({'detail': 'A valid metrics token or a staff session is required.'}, status=401)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @csrf_exempt
 def method_not_allowed(request, *args, **kwargs):
     response_data = {
@@ -45,17 +45,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Backend.books.middleware.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'Backend.books.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Backend.books.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'Backend.urls'
+# Backend/asgi.py serves the async views.
+ROOT_URLCONF = 'Backend.asgi_urls' if os.environ.get('BOOKS_ASYNC_VIEWS') == '1' else 'Backend.urls'
 
 TEMPLATES = [
     {
@@ -75,7 +79,17 @@ TEMPLATES = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Backend.books.auth.PrincipalJWTAuthentication',
+    ),
+    # orjson-backed JSON (stdlib json when orjson is not installed), same output as DRF's classes.
+    'DEFAULT_RENDERER_CLASSES': (
+        'Backend.books.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'Backend.books.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 SIMPLE_JWT = {
@@ -86,8 +100,13 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_MAX_LIFETIME': timedelta(days=60),
     'SLIDING_TOKEN_NAME': 'refresh_token',
     'SLIDING_TOKEN_USER_ID_CLAIM': 'user_id',
+    'TOKEN_OBTAIN_SERIALIZER': 'Backend.books.auth.PrincipalTokenObtainPairSerializer',
 }
+# Without a shared cache (BOOKS_CACHE_DIR), a user changed by another process is trusted for up to this many seconds.
+AUTH_PRINCIPAL_CACHE_SIZE = 1024
+AUTH_PRINCIPAL_CACHE_TTL = 60
 WSGI_APPLICATION = 'Backend.wsgi.application'
+ASGI_APPLICATION = 'Backend.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
@@ -99,6 +118,121 @@ DATABASES = {
     }
 }
 
+# Production profile (BOOKS_DB_PROFILE=production): WAL so readers and the writer
+# don't block each other, tuned pragmas applied to every new connection by
+# Backend.books.db, persistent connections, and reads routed to a read-only
+# connection on the same file. bench_sqlite measures the same pragmas.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+if os.environ.get('BOOKS_DB_PROFILE') == 'production':
+    SQLITE_PATH = os.environ.get('BOOKS_SQLITE_PATH', str(BASE_DIR / 'db.sqlite3'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'timeout': 5},
+            'PRAGMAS': {'journal_mode': 'WAL', **SQLITE_PRAGMAS},
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'file:{SQLITE_PATH}?mode=ro',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'timeout': 5, 'uri': True},
+            'PRAGMAS': {**SQLITE_PRAGMAS, 'query_only': 1},
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_ROUTERS = ['Backend.books.db.ReadReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Local memory is private to each worker process, so invalidations made by one
+# worker are not seen by the others. Set BOOKS_CACHE_DIR to a directory shared
+# by all workers to switch to the file-based backend.
+# Cache versions (Backend.books.cache) live in an alias of their own: culling the
+# response cache once it is full must not take them along. The file backend lists
+# its whole directory on every write to decide on culling, so neither alias can be
+# allowed to grow without bound.
+
+if os.environ.get('BOOKS_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['BOOKS_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(os.environ['BOOKS_CACHE_DIR'], 'versions'),
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'books',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'books-versions',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+    }
+RESPONSE_CACHE_ALIAS = 'default'
+VERSION_CACHE_ALIAS = 'versions'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('BOOKS_RESPONSE_CACHE_TIMEOUT', 300))  # 0 disables response caching
+# Responses smaller than this many bytes are not compressed.
+COMPRESSION_MIN_SIZE = 1024
+
+# Requests taking longer than this many seconds are logged with their slowest queries.
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('BOOKS_SLOW_REQUEST_THRESHOLD', 1.0))
+# Bearer token for scraping /metrics/. Staff sessions can read it too; unset, so can anyone, but only under DEBUG.
+METRICS_TOKEN = os.environ.get('BOOKS_METRICS_TOKEN')
+# Staff requests sending an X-Profile header are profiled, and so is this share of all
+# requests. The latest PROFILE_KEEP profiles are listed on /profiles/.
+PROFILE_SAMPLE_RATE = float(os.environ.get('BOOKS_PROFILE_SAMPLE_RATE', 0))
+PROFILE_KEEP = 50
+
+# Leaderboards (refreshed by a job after each review write, and fully by refresh_leaderboards).
+# Top rated ranks by the mean rating smoothed towards the catalog mean, as if every book had
+# LEADERBOARD_PRIOR_WEIGHT extra reviews of the mean; trending by the review count in the
+# window, each review counting half as much every half-life.
+LEADERBOARD_PRIOR_WEIGHT = 10
+LEADERBOARD_MIN_REVIEWS = 1
+LEADERBOARD_TRENDING_HALF_LIFE_DAYS = 7
+LEADERBOARD_TRENDING_WINDOW_DAYS = 28
+
+# Background jobs (Backend.books.jobs), run by `manage.py run_workers`. A failing job is
+# retried JOB_MAX_ATTEMPTS times in all, waiting JOB_RETRY_DELAY_SECONDS, then twice as long
+# each time. Finished jobs, and their idempotency keys, are kept JOB_KEEP_DAYS. Jobs bump
+# response cache versions, so with the local memory cache only the worker's own cache would
+# see them: run_workers refuses to start unless BOOKS_CACHE_DIR is set (and shared with the
+# web processes). The Procfile points both processes at the same directory. A job whose
+# worker died is taken over when its lease runs out, which counts as one of its attempts.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY_SECONDS = 5
+JOB_MAX_RETRY_DELAY_SECONDS = 3600
+JOB_LEASE_SECONDS = 300
+JOB_KEEP_DAYS = 7
+
+# Largest JSON array accepted by the batch POST endpoints for books and reviews.
+BATCH_WRITE_MAX_SIZE = 1000
+# Most reviews one POST to /reviews/moderation/ may approve or reject.
+MODERATION_MAX_BATCH_SIZE = 10000
+
+# Admin changelists longer than this show an estimated row count instead of running COUNT(*).
+ADMIN_COUNT_LIMIT = 10000
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -18,7 +18,8 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from Backend.books import views
-from Backend.books.views import AuthorView, BookView, ReviewView, UserDetailsView, LoginView
+from Backend.books.views import AuthorView, BookView, ReviewView, UserDetailsView, LoginView, SearchView, \
+    CacheStatsView, LeaderboardView, ModerationView, ProfileView, SimilarBooksView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,12 +31,21 @@ urlpatterns = [
     path('authors/<int:author_id>/', AuthorView.as_view(), name='author-detail'),
     path('books/', BookView.as_view(), name='book-list'),
     path('books/<int:book_id>/', BookView.as_view(), name='book-single'),
+    path('books/<int:book_id>/similar/', SimilarBooksView.as_view(), name='book-similar'),
     path('author/<int:author_id>/books/', BookView.as_view(), name='book-list'),
     path('author/<int:author_id>/books/<int:book_id>/', BookView.as_view(), name='book-detail'),
     path('reviews/<int:review_id>/', ReviewView.as_view(), name='review-single'),
     path('reviews/', ReviewView.as_view(), name='review-list'),
+    path('reviews/moderation/', ModerationView.as_view(), name='review-moderation'),
     path('author/<int:author_id>/book/<int:book_id>/reviews', ReviewView.as_view(), name='review-detail'),
     path('author/<int:author_id>/book/<int:book_id>/reviews/<int:review_id>/', ReviewView.as_view(), name='review-detail'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('leaderboards/<slug:board>/', LeaderboardView.as_view(), name='leaderboard'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiles/', ProfileView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>/', ProfileView.as_view(), name='profile-detail'),
+    path('profiles/<str:profile_id>/<str:kind>/', ProfileView.as_view(), name='profile-download'),
 
     path('<path:path>', views.method_not_allowed),
 ]